@@ -0,0 +1,330 @@
+"""
+Admission control: per-user rate limits, in-flight caps and load shedding.
+
+Runs as a before_request hook (app.py) so abusive or excess requests are
+rejected before they touch the database or S3, and well-behaved users
+keep getting the worker threads, S3 connections and DB capacity.
+
+In order, a request is rejected when
+
+1. the worker already has ADMISSION_MAX_INFLIGHT requests in progress
+   (503, the system is overloaded),
+2. the user's token bucket for this route is empty (429),
+3. the user already has the route's maximum uploads/downloads/exports
+   in flight (429),
+4. the worker already has ADMISSION_MAX_TRANSFERS uploads, downloads
+   and exports in progress (503).
+
+Every rejection carries Retry-After and is counted on /metrics as
+admission_shed_total{route, reason}. Users are identified by session
+user_id, or by client address before login (taken from X-Forwarded-For
+behind the load balancer, see PROXY_HOPS in app.py).
+
+Buckets and in-flight counts live in this process by default, so each
+worker enforces its own share of the limit. Set ADMISSION_REDIS_URL
+(any Redis, e.g. a local redis-server) to keep them in Redis so limits
+hold across workers and instances. If Redis is unreachable, admission
+falls back to the in-process store rather than failing requests.
+The worker-level limits (1 and 4) always stay in-process: they protect
+this worker's threads.
+"""
+#------------------------------- imports -------------------------------------#
+import logging
+import math
+import os
+import threading
+import time
+
+from flask import Response, g, request, session
+
+import metrics
+
+
+log = logging.getLogger(__name__)
+
+# Endpoints that are never limited (probes, scrapes, static files).
+EXEMPT = {"static", "liveness", "readiness", "metrics", "db_check"}
+
+# Endpoints that move photo bytes: capped per user and per worker.
+TRANSFERS = {"upload", "download", "export"}
+
+# endpoint -> (requests per second, burst, max in flight per user or None).
+# Each value can be overridden with ADMISSION_<ENDPOINT>_RATE / _BURST /
+# _INFLIGHT; "default" applies to every other endpoint.
+RULES = {
+    "upload":   (1.0, 20, 2),
+    "download": (10.0, 50, 4),
+    "export":   (0.05, 2, 1),
+    "login":    (0.5, 10, None),
+    "signup":   (0.1, 5, None),
+    "default":  (20.0, 60, None),
+}
+
+# Idle buckets kept in process before pruning.
+MAX_KEYS = 100000
+# Seconds to use the in-process store after a Redis error.
+REDIS_RETRY = 5
+
+
+def _setting(endpoint, field, default):
+    raw = os.environ.get(f"ADMISSION_{endpoint.upper()}_{field}")
+    if raw is None:
+        return default
+    return None if raw.lower() == "none" else float(raw)
+
+
+def rule(endpoint):
+    """(rate, burst, inflight) for endpoint, with env overrides applied."""
+    name = endpoint if endpoint in RULES else "default"
+    rate, burst, inflight = RULES[name]
+    return (_setting(name, "RATE", rate),
+            _setting(name, "BURST", burst),
+            _setting(name, "INFLIGHT", inflight))
+
+
+def enabled():
+    return os.environ.get("ADMISSION_ENABLED", "1") != "0"
+
+
+def max_inflight():
+    return int(os.environ.get("ADMISSION_MAX_INFLIGHT", "64"))
+
+
+def max_transfers():
+    return int(os.environ.get("ADMISSION_MAX_TRANSFERS", "16"))
+
+
+def retry_after_overload():
+    return int(os.environ.get("ADMISSION_RETRY_AFTER", "2"))
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+
+class LocalStore:
+    """Token buckets and in-flight counters in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}    # key -> [tokens, last refill time]
+        self._inflight = {}   # key -> count
+
+    def take(self, key, rate, burst):
+        """Take one token; return 0 if granted, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_KEYS:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def _prune(self, now):
+        # Every rule refills within an hour, so older buckets are full and carry no state.
+        full = [k for k, (tokens, ts) in self._buckets.items() if now - ts > 3600]
+        for k in full or list(self._buckets)[:MAX_KEYS // 10]:
+            del self._buckets[k]
+
+    def acquire(self, key, limit):
+        with self._lock:
+            count = self._inflight.get(key, 0)
+            if count >= limit:
+                return False
+            self._inflight[key] = count + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            count = self._inflight.get(key, 0) - 1
+            if count > 0:
+                self._inflight[key] = count
+            else:
+                self._inflight.pop(key, None)
+
+
+# Token bucket refilled from the Redis server clock; returns the wait in seconds.
+_TAKE_LUA = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# In-flight counter; the TTL clears slots held by a worker that died.
+_ACQUIRE_LUA = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+if n > tonumber(ARGV[1]) then
+  redis.call('DECR', KEYS[1])
+  return 0
+end
+return 1
+"""
+
+# Give a slot back, never below zero (the key may have expired meanwhile).
+_RELEASE_LUA = """
+local n = tonumber(redis.call('GET', KEYS[1]) or '0')
+if n > 0 then return redis.call('DECR', KEYS[1]) end
+return 0
+"""
+
+
+class RedisStore:
+    """Token buckets and in-flight counters shared through Redis."""
+
+    PREFIX = "admission:"
+    SLOT_TTL = 600
+
+    def __init__(self, url):
+        import redis   # optional dependency, only needed with ADMISSION_REDIS_URL
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._take = self._redis.register_script(_TAKE_LUA)
+        self._acquire = self._redis.register_script(_ACQUIRE_LUA)
+        self._release = self._redis.register_script(_RELEASE_LUA)
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[self.PREFIX + "b:" + key], args=[rate, burst]))
+
+    def acquire(self, key, limit):
+        return bool(self._acquire(keys=[self.PREFIX + "f:" + key], args=[int(limit), self.SLOT_TTL]))
+
+    def release(self, key):
+        self._release(keys=[self.PREFIX + "f:" + key])
+
+
+_local = LocalStore()
+_shared = None
+_shared_lock = threading.Lock()
+_shared_down_until = 0.0   # skip Redis until then after an error
+
+# Worker-wide depth: always in-process.
+_depth_lock = threading.Lock()
+_depth = {"all": 0, "transfers": 0}
+
+
+def _shared_store():
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = RedisStore(os.environ["ADMISSION_REDIS_URL"])
+    return _shared
+
+
+def _redis_failed():
+    global _shared_down_until
+    _shared_down_until = time.monotonic() + REDIS_RETRY
+    metrics.inc("admission_store_errors_total")
+    log.warning("admission store unavailable, using in-process limits", exc_info=True)
+
+
+def _call(method, *args):
+    """
+    Run a store operation on Redis when configured, else in process.
+    Returns (store, result) so a slot can be released to the store that
+    granted it. On a Redis error, use the in-process store and leave
+    Redis alone for REDIS_RETRY seconds so requests do not each wait for
+    a timeout.
+    """
+    if os.environ.get("ADMISSION_REDIS_URL") and time.monotonic() >= _shared_down_until:
+        try:
+            store = _shared_store()
+            return store, getattr(store, method)(*args)
+        except Exception:
+            _redis_failed()
+    return _local, getattr(_local, method)(*args)
+
+
+def _release_slot(store, key):
+    # Always the store that granted the slot: releasing elsewhere would
+    # leave the Redis counter up (locking the user out until SLOT_TTL) or
+    # hand out extra slots.
+    try:
+        store.release(key)
+    except Exception:
+        _redis_failed()
+
+
+# ---------------------------------------------------------------------------
+# Request hooks
+# ---------------------------------------------------------------------------
+
+def _enter(kind, limit):
+    with _depth_lock:
+        if _depth[kind] >= limit:
+            return False
+        _depth[kind] += 1
+        metrics.set_gauge("admission_inflight", _depth[kind], kind=kind)
+        return True
+
+
+def _leave(kind):
+    with _depth_lock:
+        _depth[kind] -= 1
+        metrics.set_gauge("admission_inflight", _depth[kind], kind=kind)
+
+
+def _shed(endpoint, reason, status, retry_after):
+    metrics.inc("admission_shed_total", route=endpoint, reason=reason)
+    message = "Too many requests" if status == 429 else "Server busy"
+    resp = Response(f"{message}, retry in {retry_after} s.\n", status=status, mimetype="text/plain")
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp
+
+
+def admit():
+    """before_request hook: admit the request or return a 429/503 response."""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT or not enabled():
+        return None
+
+    held = g.admission = []
+    if not _enter("all", max_inflight()):
+        return _shed(endpoint, "overload", 503, retry_after_overload())
+    held.append(("depth", "all"))
+
+    user_id = session.get("user_id")
+    who = f"user:{user_id}" if user_id is not None else f"ip:{request.remote_addr}"
+    rate, burst, inflight = rule(endpoint)
+
+    _, wait = _call("take", f"{who}:{endpoint}", rate, burst)
+    if wait > 0:
+        return _shed(endpoint, "rate", 429, max(1, math.ceil(wait)))
+
+    if inflight is not None:
+        slot = f"{who}:{endpoint}"
+        store, granted = _call("acquire", slot, inflight)
+        if not granted:
+            return _shed(endpoint, "user_inflight", 429, 1)
+        held.append(("slot", slot, store))
+
+    if endpoint in TRANSFERS:
+        if not _enter("transfers", max_transfers()):
+            return _shed(endpoint, "transfers", 503, retry_after_overload())
+        held.append(("depth", "transfers"))
+    return None
+
+
+def release(exc=None):
+    """teardown_request hook: give back whatever admit() took."""
+    for kind, key, *store in reversed(g.pop("admission", [])):
+        if kind == "depth":
+            _leave(key)
+        else:
+            _release_slot(store[0], key)
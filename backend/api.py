@@ -0,0 +1,83 @@
+"""
+JSON API helpers: pagination, compact photo serialization and
+compressed JSON responses.
+
+Used by the /api/photos and /api/search routes that feed the gallery's
+infinite scroll. The first page is still rendered server-side by
+home/gallery/search; later pages come from here.
+
+Serialization uses orjson when it is installed (several times faster
+than the json module) and falls back to compact stdlib json otherwise.
+Bodies over GZIP_MIN_BYTES are gzip-compressed for clients that accept it.
+"""
+#------------------------------- imports -------------------------------------#
+import gzip
+import os
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:   # optional speed-up
+    orjson = None
+    import json
+
+
+GZIP_MIN_BYTES = 1024
+MAX_PAGE_SIZE = 100
+
+
+def page_size():
+    return int(os.environ.get("GALLERY_PAGE_SIZE", "24"))
+
+
+def parse_page():
+    """
+    Return (before, size) from ?before=&size=. before is the id of the
+    last photo on the previous page (None for the first page).
+    """
+    try:
+        before = request.args.get("before", type=int)
+        size = int(request.args.get("size", page_size()))
+    except ValueError:
+        before, size = None, page_size()
+    return before, min(max(1, size), MAX_PAGE_SIZE)
+
+
+def fetch_page(fetch, size, before=None):
+    """
+    Call fetch(limit=, before=) for one page, asking for one extra row to
+    learn whether another page exists. Pages are keyset-paginated: the
+    next one starts after the last row of this one, so deep pages cost
+    the backends no more than the first. Returns (rows, next_before),
+    next_before being None on the last page.
+    """
+    rows = fetch(limit=size + 1, before=before)
+    return rows[:size], rows[size - 1]["id"] if len(rows) > size else None
+
+
+def compact(photo):
+    """Only the fields the gallery grid renders."""
+    return {
+        "id": photo["id"],
+        "key": photo["s3_key"],
+        "title": photo.get("title") or photo.get("original_name"),
+    }
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), default=str).encode()
+
+
+def json_response(payload, status=200):
+    """Serialize payload, gzip it if worthwhile and accepted, and wrap it in a Response."""
+    body = _dumps(payload)
+    resp = Response(status=status, mimetype="application/json")
+    resp.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+        body = gzip.compress(body, compresslevel=6)
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.set_data(body)
+    return resp
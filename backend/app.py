@@ -6,6 +6,11 @@ Keep this file small: no business logic here, only wiring.
 """
 #------------------------------- imports -------------------------------#
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+import admission
+import health
+import profiler
+import resilience
 from routes import app_routes
 
 
@@ -19,12 +24,40 @@ app = Flask(__name__, static_folder='assets', static_url_path='/assets')
 import os
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-change-on-ec2")
 
+# Behind the load balancer request.remote_addr is the balancer's address;
+# take the client's from the last PROXY_HOPS X-Forwarded-For entries so
+# per-client limits (admission.py) are not shared by every visitor.
+# Set PROXY_HOPS=0 when the app is reachable directly, or clients could
+# spoof their address.
+_proxy_hops = int(os.environ.get("PROXY_HOPS", "1"))
+if _proxy_hops:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=_proxy_hops)
+
 # ---------------------------------------------------------------------------
 # App routes: attach URL paths to handlers (login, upload, gallery, etc. in routes.py)
 # ---------------------------------------------------------------------------
 
 app_routes(app)
 
+# Opt-in per-request sampling profiler (X-Profile header or PROFILE_SAMPLE).
+# Registered first so its hooks cover the rest of the request.
+profiler.init_app(app)
+
+# Background readiness prober (backend + S3), cached for /readyz and /db-check.
+# Started on the first request, not at import, so worker start-up does not
+# pay for the backend and AWS SDK imports the probes trigger.
+app.before_request(health.start)
+
+# Per-request time budget for S3/DB calls; calls that fail fast because a
+# dependency is down or the budget is spent become 503 + Retry-After.
+app.before_request(resilience.begin_request)
+app.teardown_request(resilience.end_request)
+app.register_error_handler(resilience.Unavailable, resilience.error_response)
+
+# Per-user rate limits, in-flight caps and load shedding (admission.py).
+app.before_request(admission.admit)
+app.teardown_request(admission.release)
+
 
 # ---------------------------------------------------------------------------
 # Run the development server (python app.py)
@@ -0,0 +1,143 @@
+// Cube Portfolio gallery with infinite scroll.
+// The first page is rendered by the server; later pages are fetched as
+// compact JSON from /api/photos or /api/search and appended to the grid.
+var PortfolioGallery = function() {
+    "use strict";
+
+    var $grid = $('#portfolio-4-col-grid');
+    var $loadMore = $('#portfolio-grid-load-more');
+    var $link = $loadMore.find('.cbp-l-loadMore-link');
+    var base = $loadMore.data('base');
+    var next = $loadMore.data('next') || null;
+    var loading = false;
+
+    var escapeHtml = function(text) {
+        return $('<div>').text(text == null ? '' : text).html();
+    };
+
+    // Same markup as the server-rendered items in index.html / search.html.
+    // pageIds: ids of the fetched page, for prev/next on the detail page.
+    var itemHtml = function(photo, pageIds) {
+        var src = escapeHtml(base + photo.key);
+        return '<div class="cbp-item idea web-design theme-portfolio-item-v2 theme-portfolio-item-xs">' +
+            '<div class="cbp-caption">' +
+                '<div class="cbp-caption-defaultWrap theme-portfolio-active-wrap">' +
+                    '<img src="' + src + '" alt="">' +
+                    '<div class="theme-icons-wrap theme-portfolio-lightbox">' +
+                        '<a class="cbp-lightbox" href="' + src + '" data-title="Portfolio">' +
+                            '<i class="theme-icons theme-icons-white-bg theme-icons-sm radius-3 icon-focus"></i>' +
+                        '</a>' +
+                    '</div>' +
+                '</div>' +
+            '</div>' +
+            '<div class="theme-portfolio-title-heading">' +
+                '<h4 class="theme-portfolio-title">' +
+                    '<a href="/photo/' + photo.id + '?ids=' + pageIds + '">' + escapeHtml(photo.title) + '</a>' +
+                '</h4>' +
+            '</div>' +
+        '</div>';
+    };
+
+    var stop = function() {
+        next = null;
+        $link.removeClass('cbp-l-loadMore-loading').addClass('cbp-l-loadMore-stop');
+    };
+
+    var loadNext = function() {
+        if (!next || loading) {
+            return;
+        }
+        loading = true;
+        $link.addClass('cbp-l-loadMore-loading');
+
+        $.getJSON(next).done(function(data) {
+            next = data.next;
+            var pageIds = $.map(data.photos, function(photo) { return photo.id; }).join(',');
+            var html = $.map(data.photos, function(photo) { return itemHtml(photo, pageIds); }).join('');
+            var done = function() {
+                loading = false;
+                $link.removeClass('cbp-l-loadMore-loading');
+                if (!next) {
+                    stop();
+                } else {
+                    handleScroll(); // keep going if the page is still short
+                }
+            };
+            if (html) {
+                $grid.cubeportfolio('appendItems', html, done);
+            } else {
+                done();
+            }
+        }).fail(function() {
+            loading = false;
+            $link.removeClass('cbp-l-loadMore-loading');
+        });
+    };
+
+    var handleScroll = function() {
+        if (next && $(window).scrollTop() + $(window).height() >= $loadMore.offset().top - 400) {
+            loadNext();
+        }
+    };
+
+    var handlePortfolio4ColGrid = function() {
+        $grid.cubeportfolio({
+            filters: '#portfolio-4-col-grid-filter',
+            layoutMode: 'grid',
+            defaultFilter: '*',
+            animationType: 'rotateRoom',
+            gapHorizontal: 30,
+            gapVertical: 30,
+            gridAdjustment: 'responsive',
+            mediaQueries: [{
+                width: 1500,
+                cols: 4
+            }, {
+                width: 1100,
+                cols: 4
+            }, {
+                width: 800,
+                cols: 4
+            }, {
+                width: 550,
+                cols: 2
+            }, {
+                width: 320,
+                cols: 1
+            }],
+            caption: ' ',
+            displayType: 'bottomToTop',
+            displayTypeSpeed: 100,
+
+            // lightbox
+            lightboxDelegate: '.cbp-lightbox',
+            lightboxGallery: true,
+            lightboxTitleSrc: 'data-title',
+            lightboxCounter: '<div class="cbp-popup-lightbox-counter">{{current}} of {{total}}</div>',
+        }, function() {
+            if (!$loadMore.length) {
+                return;
+            }
+            if (!next) {
+                stop();
+                return;
+            }
+            $link.on('click', function(e) {
+                e.preventDefault();
+                loadNext();
+            });
+            $(window).on('scroll', handleScroll);
+            handleScroll();
+        });
+    };
+
+    return {
+        init: function() {
+            handlePortfolio4ColGrid(); // initial setup for portfolio grid with infinite scroll
+        }
+    }
+}();
+
+$(document).ready(function() {
+    PortfolioGallery.init();
+});
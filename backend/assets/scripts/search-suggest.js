@@ -0,0 +1,25 @@
+// Search-as-you-type: fill the #query datalist from /search/suggest.
+jQuery(document).ready(function($){
+	var $input = $('#query'),
+		$list = $('<datalist id="query-suggestions"></datalist>').insertAfter($input),
+		timer = null,
+		last = '';
+
+	$input.attr({'list': 'query-suggestions', 'autocomplete': 'off'});
+
+	$input.on('input', function() {
+		clearTimeout(timer);
+		timer = setTimeout(function() {
+			var q = $.trim($input.val());
+			if (!q || q === last) return;
+			last = q;
+			$.getJSON('/search/suggest', {q: q}, function(data) {
+				if ($.trim($input.val()) !== q) return;
+				$list.empty();
+				$.each(data.titles.concat(data.tags), function(i, s) {
+					$('<option>').attr('value', s).appendTo($list);
+				});
+			});
+		}, 120);
+	});
+});
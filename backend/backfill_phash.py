@@ -0,0 +1,60 @@
+"""
+Backfill perceptual hashes for photos uploaded before near-duplicate
+detection existed.
+
+Scans every photo in the active backend (DB_PROVIDER), downloads the
+ones without a phash from S3 on a thread pool, hashes them on the
+process pool from phash.py and writes the hash back.
+
+Run once from EC2: python backfill_phash.py
+Env: BACKFILL_THREADS (S3 download concurrency, default 16)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import clients
+import db
+import phash
+import resilience
+
+
+def _fetch(photo):
+    """Download one photo; returns (photo, bytes) or (photo, exception)."""
+    try:
+        obj = resilience.call("s3", clients.s3().get_object,
+                              Bucket=photo["s3_bucket"], Key=photo["s3_key"], idempotent=True)
+        return photo, obj["Body"].read()
+    except Exception as e:
+        return photo, e
+
+
+def main():
+    todo = [p for p in db.scan_photos() if not p.get("phash")]
+    print(f"Photos missing phash: {len(todo)}")
+
+    threads = int(os.environ.get("BACKFILL_THREADS", "16"))
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=threads) as downloads:
+        # Work in batches so only a bounded number of images sit in memory.
+        for start in range(0, len(todo), threads * 4):
+            batch = todo[start:start + threads * 4]
+            hashing = []
+            for photo, body in downloads.map(_fetch, batch):
+                if isinstance(body, Exception):
+                    print(f"Photo {photo['id']}: {body}")
+                    failed += 1
+                else:
+                    hashing.append((photo, phash.submit(body)))
+            for photo, future in hashing:
+                try:
+                    db.set_photo_phash(photo["id"], photo["user_id"], future.result())
+                    done += 1
+                except Exception as e:
+                    print(f"Photo {photo['id']}: {e}")
+                    failed += 1
+
+    print(f"Hashed: {done}  failed: {failed}")
+
+
+if __name__ == "__main__":
+    main()
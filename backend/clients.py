@@ -0,0 +1,77 @@
+"""
+Shared AWS SDK clients.
+
+Building a boto3 client is expensive (credential lookup, endpoint
+resolution, a fresh connection pool) so each worker process builds one
+S3 client and reuses it for every request.
+
+boto3 clients are thread-safe; resources are not, so the DynamoDB
+resource is kept per thread.
+
+boto3 itself is imported on first use: it is the most expensive import
+in the app, and workers that serve only MySQL, static assets or health
+checks may never need it.
+
+Clients do not retry on their own; retries, backoff and circuit
+breaking are resilience.py's job. Each request's read timeout is set
+just before it is sent to resilience.attempt_timeout(): DEPENDENCY_TIMEOUT
+or what is left of the request budget, whichever is less. Opening a new
+connection is capped separately at DEPENDENCY_CONNECT_TIMEOUT (botocore
+fixes the connect timeout per client), so an attempt that has to connect
+can overrun the budget by at most that much.
+"""
+#------------------------------- imports -------------------------------------#
+import os
+import threading
+
+import resilience
+
+
+_lock = threading.Lock()
+_s3 = None
+_local = threading.local()
+
+
+def region():
+    return os.environ.get("AWS_REGION", "us-east-2")
+
+
+def _config():
+    from botocore.config import Config
+    timeout = resilience.dependency_timeout()
+    connect = min(timeout, float(os.environ.get("DEPENDENCY_CONNECT_TIMEOUT", "1")))
+    return Config(connect_timeout=connect, read_timeout=timeout,
+                  retries={"mode": "standard", "total_max_attempts": 1})
+
+
+def _bound_attempt(request, **kwargs):
+    # botocore reads a per-request read timeout from the request context.
+    request.context["read_timeout"] = resilience.attempt_timeout()
+
+
+def _bounded(client):
+    client.meta.events.register("before-send", _bound_attempt)
+    return client
+
+
+def s3():
+    """Return the process-wide S3 client, creating it on first use."""
+    global _s3
+    if _s3 is None:
+        with _lock:
+            if _s3 is None:
+                import boto3
+                _s3 = _bounded(boto3.client("s3", region_name=region(), config=_config()))
+    return _s3
+
+
+def dynamodb():
+    """Return this thread's DynamoDB resource, creating it on first use."""
+    resource = getattr(_local, "dynamodb", None)
+    if resource is None:
+        with _lock:
+            import boto3
+            resource = boto3.session.Session().resource("dynamodb", region_name=region(), config=_config())
+            _bounded(resource.meta.client)
+        _local.dynamodb = resource
+    return resource
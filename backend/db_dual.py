@@ -0,0 +1,250 @@
+"""
+Dual-write / shadow-read backend for zero-downtime backend switches.
+
+db.py imports these when DB_PROVIDER=dual:
+
+  DB_PRIMARY=dynamo        backend that serves every read (source of truth)
+  DB_SECONDARY=mongo       backend being migrated to
+  DB_SHADOW_SAMPLE=0.1     fraction of reads repeated on the secondary
+
+Supported pairs are dynamo -> mongo and mongo -> dynamo. MySQL cannot
+take part: its ids are BIGINT AUTO_INCREMENT while the other backends
+use UUID user ids, so forwarded ids would not fit. Importing this module
+with mysql on either side raises RuntimeError.
+
+Writes (create_user, add_photo, set_photo_phash) go to the primary and
+then to the secondary, with the primary's ids forwarded so both hold the
+same records. A failed secondary write is logged and counted but never
+fails the request, and readiness (ping) follows the primary only.
+
+A sample of reads is repeated against the secondary on a small
+background pool, off the request path; if the pool is backed up the
+shadow read is dropped rather than queued. Both latencies are recorded
+and results are compared (ignoring field order, types and
+uploaded_at). report() and the /db-shadow route summarise per-function
+latency for both backends plus mismatch counts (and, via the health
+prober's cached ping_secondary() result, whether the secondary is up), which is the evidence
+for cutting over: switch DB_PROVIDER to the secondary once it is as fast
+and has stopped mismatching.
+
+Records written before dual-write was enabled must be copied separately
+(e.g. migrate_ddb_to_mongo.py during a quiet period); until then they
+show up as mismatches.
+"""
+#------------------------------- imports -------------------------------------#
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import metrics
+
+
+log = logging.getLogger(__name__)
+
+# Latency samples kept per (function, role) for report().
+SAMPLES = 1000
+# Fields that legitimately differ between backends.
+IGNORED_FIELDS = {"uploaded_at"}
+
+_primary_name = os.environ.get("DB_PRIMARY", "dynamo")
+_secondary_name = os.environ.get("DB_SECONDARY", "mongo")
+SUPPORTED = {"dynamo", "mongo"}
+if {_primary_name, _secondary_name} != SUPPORTED:
+    raise RuntimeError(
+        f"DB_PROVIDER=dual does not support DB_PRIMARY={_primary_name!r} with "
+        f"DB_SECONDARY={_secondary_name!r}; use dynamo and mongo (either way round). "
+        "MySQL's integer ids cannot hold the UUID user ids the other backends forward.")
+_primary = db.backend(_primary_name)
+_secondary = db.backend(_secondary_name)
+
+_shadow_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("DB_SHADOW_WORKERS", "2")),
+                                  thread_name_prefix="db-shadow")
+_shadow_slots = threading.BoundedSemaphore(int(os.environ.get("DB_SHADOW_QUEUE", "32")))
+
+_lock = threading.Lock()
+_samples = {}   # (fn, role) -> deque of seconds
+_counts = {}    # (fn, what) -> int
+
+
+def _sample_rate():
+    return float(os.environ.get("DB_SHADOW_SAMPLE", "0.1"))
+
+
+# ---------------------------------------------------------------------------
+# Bookkeeping
+# ---------------------------------------------------------------------------
+
+def _record(fn, role, seconds):
+    backend = _primary_name if role == "primary" else _secondary_name
+    metrics.observe("db_call_seconds", seconds, fn=fn, backend=backend, role=role)
+    with _lock:
+        _samples.setdefault((fn, role), deque(maxlen=SAMPLES)).append(seconds)
+
+
+def _count(fn, what):
+    metrics.inc(f"db_shadow_{what}_total", fn=fn)
+    with _lock:
+        _counts[(fn, what)] = _counts.get((fn, what), 0) + 1
+
+
+def _timed(fn, role, backend, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return getattr(backend, fn)(*args, **kwargs)
+    finally:
+        _record(fn, role, time.perf_counter() - start)
+
+
+def _normalize(value):
+    """Reduce a backend result to a comparable form."""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()
+                if v is not None and k not in IGNORED_FIELDS}
+    if isinstance(value, (list, tuple)):
+        items = [_normalize(v) for v in value]
+        return sorted(items, key=lambda d: str(d.get("id")) if isinstance(d, dict) else str(d))
+    return str(value)
+
+
+def _same(a, b):
+    a, b = _normalize(a), _normalize(b)
+    if isinstance(a, dict) and isinstance(b, dict):
+        # Backends return different optional columns; compare shared ones.
+        keys = a.keys() & b.keys()
+        return all(a[k] == b[k] for k in keys)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+# ---------------------------------------------------------------------------
+# Read / write wrappers
+# ---------------------------------------------------------------------------
+
+def _shadow(fn, expected, args, kwargs):
+    try:
+        actual = _timed(fn, "secondary", _secondary, *args, **kwargs)
+        if _same(expected, actual):
+            _count(fn, "matches")
+        else:
+            _count(fn, "mismatches")
+            log.warning("shadow mismatch in %s%r", fn, args)
+    except Exception:
+        _count(fn, "errors")
+        log.exception("shadow read %s failed", fn)
+    finally:
+        _shadow_slots.release()
+
+
+def _read(fn, *args, **kwargs):
+    result = _timed(fn, "primary", _primary, *args, **kwargs)
+    if random.random() < _sample_rate():
+        if _shadow_slots.acquire(blocking=False):
+            _shadow_pool.submit(_shadow, fn, result, args, kwargs)
+        else:
+            _count(fn, "dropped")
+    return result
+
+
+def _write_secondary(fn, *args, **kwargs):
+    try:
+        _timed(fn, "secondary", _secondary, *args, **kwargs)
+    except Exception:
+        _count(fn, "write_errors")
+        log.exception("secondary write %s failed", fn)
+
+
+# ---------------------------------------------------------------------------
+# Backend interface
+# ---------------------------------------------------------------------------
+
+def create_user(username, email, password_hash):
+    user_id = _timed("create_user", "primary", _primary, username, email, password_hash)
+    _write_secondary("create_user", username, email, password_hash, user_id=user_id)
+    return user_id
+
+
+def add_photo(user_id, s3_bucket, s3_key, original_name, **fields):
+    photo_id = _timed("add_photo", "primary", _primary, user_id, s3_bucket, s3_key, original_name, **fields)
+    _write_secondary("add_photo", user_id, s3_bucket, s3_key, original_name, photo_id=photo_id, **fields)
+    return photo_id
+
+
+def set_photo_phash(photo_id, user_id, phash):
+    _timed("set_photo_phash", "primary", _primary, photo_id, user_id, phash)
+    _write_secondary("set_photo_phash", photo_id, user_id, phash)
+
+
+def get_user_by_username(username):
+    return _read("get_user_by_username", username)
+
+
+def list_photos(user_id, limit=50, offset=0, before=None):
+    return _read("list_photos", user_id, limit, offset, before)
+
+
+def search_photos(user_id, q=None, limit=50, offset=0, before=None):
+    return _read("search_photos", user_id, q, limit, offset, before)
+
+
+def get_photo(photo_id, user_id):
+    return _read("get_photo", photo_id, user_id)
+
+
+def get_photos(user_id, ids):
+    return _read("get_photos", user_id, ids)
+
+
+def scan_photos():
+    # Bulk jobs (backfills) read the primary only.
+    return _primary.scan_photos()
+
+
+def ping():
+    # Readiness follows the primary only: it serves every read, and a
+    # secondary outage never fails a request. The health prober calls
+    # ping_secondary() separately for /db-shadow.
+    _primary.ping()
+
+
+def ping_secondary():
+    _secondary.ping()
+
+
+# ---------------------------------------------------------------------------
+# Comparison report
+# ---------------------------------------------------------------------------
+
+def _pct(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(pct / 100 * len(values)))] * 1000, 2)
+
+
+def report():
+    """Per-function latency (ms) for both backends plus shadow-read outcomes."""
+    with _lock:
+        samples = {k: list(v) for k, v in _samples.items()}
+        counts = dict(_counts)
+
+    functions = sorted({fn for fn, _ in samples} | {fn for fn, _ in counts})
+    out = {"primary": _primary_name, "secondary": _secondary_name,
+           "sample_rate": _sample_rate(), "functions": {}}
+    for fn in functions:
+        entry = {}
+        for role in ("primary", "secondary"):
+            lat = samples.get((fn, role), [])
+            entry[role] = {"n": len(lat), "p50_ms": _pct(lat, 50),
+                           "p95_ms": _pct(lat, 95), "p99_ms": _pct(lat, 99)}
+        p50s = entry["primary"]["p50_ms"], entry["secondary"]["p50_ms"]
+        entry["secondary_vs_primary_p50"] = round(p50s[1] / p50s[0], 2) if all(p50s) else None
+        for what in ("matches", "mismatches", "errors", "dropped", "write_errors"):
+            entry[what] = counts.get((fn, what), 0)
+        out["functions"][fn] = entry
+    return out
@@ -1,7 +1,7 @@
 """
 DynamoDB backend — Part A.
 
-Implements the same 6 functions as the MySQL db.py so routes.py
+Implements the same functions as the MySQL db.py so routes.py
 never needs to change. db.py imports these when DB_PROVIDER=dynamo.
 
 Table design
@@ -14,23 +14,31 @@ Photos table (env: DDB_PHOTOS_TABLE, default "photos")
   PK: user_id (S)
   SK: id (N, millisecond timestamp — keeps compatible with /download/<int:photo_id>)
   Attributes: s3_bucket, s3_key, original_name, title, description,
-              tags, content_type, size_bytes, uploaded_at
+              tags, content_type, size_bytes, phash, uploaded_at
 """
 import os
 import time
 import uuid
 from decimal import Decimal
 
-import boto3
 from boto3.dynamodb.conditions import Key
 
+import clients
+import resilience
+
+
+# BatchGetItem accepts at most 100 keys per request.
+BATCH_GET_LIMIT = 100
+# Extra BatchGetItem rounds for UnprocessedKeys before giving up.
+UNPROCESSED_RETRIES = 8
+
 
 # ---------------------------------------------------------------------------
 # Helpers — get boto3 Table resources
 # ---------------------------------------------------------------------------
 
 def _ddb():
-    return boto3.resource("dynamodb", region_name=os.environ.get("AWS_REGION", "us-east-2"))
+    return clients.dynamodb()
 
 def _users():
     return _ddb().Table(os.environ.get("DDB_USERS_TABLE", "users"))
@@ -52,20 +60,38 @@ def _item_to_photo(item):
         "tags":          item.get("tags"),
         "content_type":  item.get("content_type"),
         "size_bytes":    int(item["size_bytes"]) if item.get("size_bytes") else None,
+        "phash":         item.get("phash"),
         "uploaded_at":   item.get("uploaded_at"),
     }
 
 
+# ---------------------------------------------------------------------------
+# Health
+# ---------------------------------------------------------------------------
+
+@resilience.guarded("dynamodb")
+def ping():
+    """
+    Cheap data-plane round trip for the readiness prober.
+    A GetItem on a key that never exists — unlike list_tables() it is not
+    a control-plane call, so it is not subject to the low control-plane
+    rate limits.
+    """
+    _users().get_item(Key={"username": "__healthcheck__"})
+
+
 # ---------------------------------------------------------------------------
 # User functions
 # ---------------------------------------------------------------------------
 
-def create_user(username, email, password_hash):
+@resilience.guarded("dynamodb")
+def create_user(username, email, password_hash, user_id=None):
     """
     Insert a new user row.
     Returns the new user's UUID (mirrors MySQL's lastrowid usage).
+    user_id is only passed when another backend owns id generation (db_dual.py).
     """
-    user_id = str(uuid.uuid4())
+    user_id = str(user_id) if user_id is not None else str(uuid.uuid4())
     item = {
         "username":      username,
         "id":            user_id,
@@ -77,6 +103,7 @@ def create_user(username, email, password_hash):
     return user_id
 
 
+@resilience.guarded("dynamodb", idempotent=True)
 def get_user_by_username(username):
     """
     Look up a user by username.
@@ -98,15 +125,18 @@ def get_user_by_username(username):
 # Photo functions
 # ---------------------------------------------------------------------------
 
+@resilience.guarded("dynamodb")
 def add_photo(user_id, s3_bucket, s3_key, original_name,
               title=None, description=None, tags=None,
-              content_type=None, size_bytes=None):
+              content_type=None, size_bytes=None, phash=None, photo_id=None):
     """
     Insert a new photo record.
     Uses a millisecond timestamp as the integer ID so the /download/<int:photo_id>
-    route in routes.py works without any changes.
+    route in routes.py works without any changes. photo_id is only passed when
+    another backend owns id generation (db_dual.py).
     """
-    photo_id = int(time.time() * 1000)
+    if photo_id is None:
+        photo_id = int(time.time() * 1000)
     item = {
         "user_id":       str(user_id),
         "id":            Decimal(photo_id),
@@ -120,45 +150,75 @@ def add_photo(user_id, s3_bucket, s3_key, original_name,
     if tags:         item["tags"]         = tags
     if content_type: item["content_type"] = content_type
     if size_bytes:   item["size_bytes"]   = Decimal(size_bytes)
+    if phash:        item["phash"]        = phash
 
     _photos().put_item(Item=item)
     return photo_id
 
 
-def list_photos(user_id, limit=50, offset=0):
+def _query_photos(user_id, limit=None, before=None):
     """
-    Return all photos for a user, newest first.
-    Queries on the partition key (user_id) — efficient even at scale.
+    Yield a user's photos newest first, following LastEvaluatedKey across
+    pages (a Query returns at most 1 MB). limit, if given, caps the items
+    read: no more pages are requested once that many have been yielded.
+    before (a photo id) starts the query just after that photo.
     """
-    resp = _photos().query(
-        KeyConditionExpression=Key("user_id").eq(str(user_id)),
-        ScanIndexForward=False,   # newest first (descending sort key)
-    )
-    items = [_item_to_photo(i) for i in resp.get("Items", [])]
-    return items[offset: offset + limit]
+    kwargs = {
+        "KeyConditionExpression": Key("user_id").eq(str(user_id)),
+        "ScanIndexForward": False,   # newest first (descending sort key)
+    }
+    if before is not None:
+        kwargs["ExclusiveStartKey"] = {"user_id": str(user_id), "id": Decimal(before)}
+    read = 0
+    while limit is None or read < limit:
+        if limit is not None:
+            kwargs["Limit"] = limit - read
+        resp = _photos().query(**kwargs)
+        for item in resp.get("Items", []):
+            read += 1
+            yield _item_to_photo(item)
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return
+        kwargs["ExclusiveStartKey"] = last
 
 
-def search_photos(user_id, q=None, limit=50, offset=0):
+@resilience.guarded("dynamodb", idempotent=True)
+def list_photos(user_id, limit=50, offset=0, before=None):
+    """
+    Return a page of a user's photos, newest first.
+    Queries on the partition key (user_id), reading only offset + limit
+    items. Pass before= (the last id of the previous page) rather than an
+    offset to page without re-reading the earlier pages.
+    """
+    return list(_query_photos(user_id, offset + limit, before))[offset:]
+
+
+@resilience.guarded("dynamodb", idempotent=True)
+def search_photos(user_id, q=None, limit=50, offset=0, before=None):
     """
     Search photos by title, description, tags, or original filename.
-    Fetches all photos for the user then filters in Python — acceptable
-    for the small dataset (20 photos) required by the assignment.
+    DynamoDB has no case-insensitive contains, so the user's partition is
+    read page by page and filtered in Python, stopping as soon as
+    offset + limit matches are found.
     """
     if not q:
-        return list_photos(user_id, limit, offset)
+        return list_photos(user_id, limit, offset, before)
 
-    all_photos = list_photos(user_id, limit=1000, offset=0)
     q_lower = q.lower()
-    results = [
-        p for p in all_photos
-        if q_lower in (p.get("title")         or "").lower()
-        or q_lower in (p.get("description")   or "").lower()
-        or q_lower in (p.get("tags")          or "").lower()
-        or q_lower in (p.get("original_name") or "").lower()
-    ]
-    return results[offset: offset + limit]
+    results = []
+    for p in _query_photos(user_id, before=before):
+        if (q_lower in (p.get("title")         or "").lower()
+                or q_lower in (p.get("description")   or "").lower()
+                or q_lower in (p.get("tags")          or "").lower()
+                or q_lower in (p.get("original_name") or "").lower()):
+            results.append(p)
+            if len(results) >= offset + limit:
+                break
+    return results[offset:]
 
 
+@resilience.guarded("dynamodb", idempotent=True)
 def get_photo(photo_id, user_id):
     """
     Fetch a single photo by its integer ID and owner's user_id.
@@ -172,3 +232,57 @@ def get_photo(photo_id, user_id):
     if not item:
         return None
     return _item_to_photo(item)
+
+
+@resilience.guarded("dynamodb", idempotent=True)
+def get_photos(user_id, ids):
+    """
+    Fetch several photos of one owner with BatchGetItem (100 keys per
+    request). Keys DynamoDB leaves unprocessed under load are re-requested
+    with backoff while the request budget lasts. Returns photos in the
+    order of ids; missing ones are skipped.
+    """
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    table = os.environ.get("DDB_PHOTOS_TABLE", "photos")
+    by_id = {}
+    for start in range(0, len(ids), BATCH_GET_LIMIT):
+        pending = {table: {"Keys": [{"user_id": str(user_id), "id": Decimal(i)}
+                                    for i in ids[start:start + BATCH_GET_LIMIT]]}}
+        attempt = 0
+        while pending:
+            resp = _ddb().batch_get_item(RequestItems=pending)
+            for item in resp.get("Responses", {}).get(table, []):
+                photo = _item_to_photo(item)
+                by_id[photo["id"]] = photo
+            pending = resp.get("UnprocessedKeys") or None
+            if pending:
+                delay = resilience.backoff(attempt)
+                left = resilience.remaining()
+                if attempt >= UNPROCESSED_RETRIES or (left is not None and delay >= left):
+                    raise resilience.Unavailable("dynamodb", "BatchGetItem keys still unprocessed")
+                time.sleep(delay)
+                attempt += 1
+    return [by_id[i] for i in ids if i in by_id]
+
+
+@resilience.guarded("dynamodb", idempotent=True)
+def set_photo_phash(photo_id, user_id, phash):
+    """Store the perceptual hash on an existing photo (used by the backfill job)."""
+    _photos().update_item(
+        Key={"user_id": str(user_id), "id": Decimal(photo_id)},
+        UpdateExpression="SET phash = :h",
+        ExpressionAttributeValues={":h": phash},
+    )
+
+
+def scan_photos():
+    """Yield every photo in the table (all users), page by page."""
+    kwargs = {}
+    while True:
+        resp = _photos().scan(**kwargs)
+        for item in resp.get("Items", []):
+            yield _item_to_photo(item)
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            break
+        kwargs["ExclusiveStartKey"] = last
@@ -1,8 +1,12 @@
 import os
 import time
 import uuid
+
+import pymongo
 from pymongo import MongoClient
 
+import resilience
+
 _client = None
 _db = None
 
@@ -30,12 +34,23 @@ def _photos():
     return _get_db()["photos"]
 
 
+# ---------------------------------------------------------------------------
+# Health
+# ---------------------------------------------------------------------------
+
+@resilience.guarded("mongo", scope=pymongo.timeout)
+def ping():
+    _get_db().client.admin.command("ping")
+
+
 # ---------------------------------------------------------------------------
 # User functions 
 # ---------------------------------------------------------------------------
 
-def create_user(username, email, password_hash):
-    user_id = str(uuid.uuid4())
+@resilience.guarded("mongo", scope=pymongo.timeout)
+def create_user(username, email, password_hash, user_id=None):
+    # user_id is only passed when another backend owns id generation (db_dual.py).
+    user_id = user_id if user_id is not None else str(uuid.uuid4())
 
     doc = {
         "id": user_id,
@@ -49,6 +64,7 @@ def create_user(username, email, password_hash):
     return user_id
 
 
+@resilience.guarded("mongo", idempotent=True, scope=pymongo.timeout)
 def get_user_by_username(username):
     user = _users().find_one({"username": username}, {"_id": 0})
     return user
@@ -58,11 +74,13 @@ def get_user_by_username(username):
 # Photo functions 
 # ---------------------------------------------------------------------------
 
+@resilience.guarded("mongo", scope=pymongo.timeout)
 def add_photo(user_id, s3_bucket, s3_key, original_name,
               title=None, description=None, tags=None,
-              content_type=None, size_bytes=None):
+              content_type=None, size_bytes=None, phash=None, photo_id=None):
 
-    photo_id = int(time.time() * 1000)
+    if photo_id is None:
+        photo_id = int(time.time() * 1000)
 
     doc = {
         "id": photo_id,
@@ -83,15 +101,22 @@ def add_photo(user_id, s3_bucket, s3_key, original_name,
         doc["content_type"] = content_type
     if size_bytes:
         doc["size_bytes"] = size_bytes
+    if phash:
+        doc["phash"] = phash
 
     _photos().insert_one(doc)
     return photo_id
 
 
-def list_photos(user_id, limit=50, offset=0):
+@resilience.guarded("mongo", idempotent=True, scope=pymongo.timeout)
+def list_photos(user_id, limit=50, offset=0, before=None):
+    query = {"user_id": str(user_id)}
+    if before is not None:
+        # Keyset paging: photos after the previous page's last id.
+        query["id"] = {"$lt": int(before)}
     cursor = (
         _photos()
-        .find({"user_id": str(user_id)}, {"_id": 0})
+        .find(query, {"_id": 0})
         .sort("id", -1)
         .skip(offset)
         .limit(limit)
@@ -99,9 +124,10 @@ def list_photos(user_id, limit=50, offset=0):
     return list(cursor)
 
 
-def search_photos(user_id, q=None, limit=50, offset=0):
+@resilience.guarded("mongo", idempotent=True, scope=pymongo.timeout)
+def search_photos(user_id, q=None, limit=50, offset=0, before=None):
     if not q:
-        return list_photos(user_id, limit, offset)
+        return list_photos(user_id, limit, offset, before)
 
     q_regex = {"$regex": q, "$options": "i"}
 
@@ -114,6 +140,8 @@ def search_photos(user_id, q=None, limit=50, offset=0):
             {"original_name": q_regex},
         ],
     }
+    if before is not None:
+        query["id"] = {"$lt": int(before)}
 
     cursor = (
         _photos()
@@ -126,9 +154,33 @@ def search_photos(user_id, q=None, limit=50, offset=0):
     return list(cursor)
 
 
+@resilience.guarded("mongo", idempotent=True, scope=pymongo.timeout)
 def get_photo(photo_id, user_id):
     photo = _photos().find_one(
         {"id": int(photo_id), "user_id": str(user_id)},
         {"_id": 0}
     )
     return photo
+
+
+@resilience.guarded("mongo", idempotent=True, scope=pymongo.timeout)
+def get_photos(user_id, ids):
+    """Photos among ids owned by user_id, in the order of ids; missing ones are skipped."""
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if not ids:
+        return []
+    cursor = _photos().find({"user_id": str(user_id), "id": {"$in": ids}}, {"_id": 0})
+    by_id = {doc["id"]: doc for doc in cursor}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+@resilience.guarded("mongo", idempotent=True, scope=pymongo.timeout)
+def set_photo_phash(photo_id, user_id, phash):
+    _photos().update_one(
+        {"id": int(photo_id), "user_id": str(user_id)},
+        {"$set": {"phash": phash}},
+    )
+
+
+def scan_photos():
+    return _photos().find({}, {"_id": 0})
@@ -0,0 +1,154 @@
+"""
+MySQL backend — original Project 1 implementation.
+
+db.py imports these when DB_PROVIDER=mysql (the default). Schema in
+schema.sql; apply it with init_db.py.
+"""
+import os
+
+import pymysql
+
+import resilience
+
+
+def get_conn():
+    # Connections are per call, so each one gets the current attempt's deadline.
+    timeout = resilience.attempt_timeout()
+    return pymysql.connect(
+        host=os.environ["DB_HOST"],
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASS"],
+        database=os.environ.get("DB_NAME", "photo_gallery"),
+        port=int(os.environ.get("DB_PORT", "3306")),
+        cursorclass=pymysql.cursors.DictCursor,
+        autocommit=True,
+        connect_timeout=timeout,
+        read_timeout=timeout,
+        write_timeout=timeout,
+    )
+
+
+@resilience.guarded("mysql")
+def ping():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+
+
+@resilience.guarded("mysql")
+def create_user(username, email, password_hash):
+    sql = "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (username, email, password_hash))
+            return cur.lastrowid
+
+
+@resilience.guarded("mysql", idempotent=True)
+def get_user_by_username(username):
+    sql = "SELECT id, username, email, password_hash FROM users WHERE username = %s"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (username,))
+            return cur.fetchone()
+
+
+@resilience.guarded("mysql")
+def add_photo(user_id, s3_bucket, s3_key, original_name, title=None, description=None, tags=None, content_type=None, size_bytes=None, phash=None):
+    sql = """
+    INSERT INTO photos (user_id, s3_bucket, s3_key, original_name, title, description, tags, content_type, size_bytes, phash)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (user_id, s3_bucket, s3_key, original_name, title, description, tags, content_type, size_bytes, phash))
+            return cur.lastrowid
+
+
+@resilience.guarded("mysql", idempotent=True)
+def set_photo_phash(photo_id, user_id, phash):
+    sql = "UPDATE photos SET phash = %s WHERE id = %s AND user_id = %s"
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (phash, photo_id, user_id))
+
+
+def scan_photos():
+    sql = "SELECT id, user_id, s3_bucket, s3_key, phash FROM photos"
+    with get_conn() as conn:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+            cur.execute(sql)
+            yield from cur
+
+
+def _after(before):
+    """Keyset condition for rows after photo `before` in (uploaded_at, id) DESC order."""
+    if before is None:
+        return "", ()
+    return "AND (uploaded_at, id) < (SELECT uploaded_at, id FROM photos WHERE id = %s)", (int(before),)
+
+
+@resilience.guarded("mysql", idempotent=True)
+def search_photos(user_id, q=None, limit=50, offset=0, before=None):
+    if not q:
+        return list_photos(user_id, limit, offset, before)
+    after, after_params = _after(before)
+    sql = f"""
+    SELECT id, user_id, s3_bucket, s3_key, original_name, title, description, tags, phash, uploaded_at
+    FROM photos
+    WHERE user_id = %s
+      AND (
+        title LIKE CONCAT('%%', %s, '%%')
+        OR description LIKE CONCAT('%%', %s, '%%')
+        OR tags LIKE CONCAT('%%', %s, '%%')
+      )
+      {after}
+    ORDER BY uploaded_at DESC, id DESC
+    LIMIT %s OFFSET %s
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (user_id, q, q, q, *after_params, limit, offset))
+            return cur.fetchall()
+
+
+@resilience.guarded("mysql", idempotent=True)
+def get_photo(photo_id, user_id):
+    sql = """
+    SELECT id, user_id, s3_bucket, s3_key, original_name, title, description, tags, content_type, size_bytes, phash, uploaded_at
+    FROM photos WHERE id = %s AND user_id = %s
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (photo_id, user_id))
+            return cur.fetchone()
+
+
+@resilience.guarded("mysql", idempotent=True)
+def get_photos(user_id, ids):
+    """Photos among ids owned by user_id, in the order of ids; missing ones are skipped."""
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if not ids:
+        return []
+    sql = f"""
+    SELECT id, user_id, s3_bucket, s3_key, original_name, title, description, tags, content_type, size_bytes, phash, uploaded_at
+    FROM photos WHERE user_id = %s AND id IN ({", ".join(["%s"] * len(ids))})
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (user_id, *ids))
+            by_id = {row["id"]: row for row in cur.fetchall()}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+@resilience.guarded("mysql", idempotent=True)
+def list_photos(user_id, limit=50, offset=0, before=None):
+    after, after_params = _after(before)
+    sql = f"""
+    SELECT id, user_id, s3_bucket, s3_key, original_name, title, description, tags, phash, uploaded_at
+    FROM photos WHERE user_id = %s {after} ORDER BY uploaded_at DESC, id DESC LIMIT %s OFFSET %s
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, (user_id, *after_params, limit, offset))
+            return cur.fetchall()
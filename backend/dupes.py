@@ -0,0 +1,275 @@
+"""
+Near-duplicate photo index.
+
+Each user gets a multi-index hash table over their photos' 64-bit
+perceptual hashes (see phash.py). The hash is split into four 16-bit
+chunks and each chunk keys its own dict. By the pigeonhole principle two
+hashes within Hamming distance r agree to within r // 4 bits on at least
+one chunk, so a radius-r query only probes the chunk values within
+r // 4 bits of the query's chunks (17 probes per chunk for r < 8) and
+checks the few photos found there. Lookups touch a tiny, roughly
+constant fraction of the library, so they stay fast at 100k photos per
+user where a linear scan or a BK-tree over uniformly spread hashes would
+visit most of it.
+
+Near-duplicate clusters are kept as a union-find over the hashes: one
+pass over all close pairs when an index is built, then one search per
+added photo, so /duplicates only has to group photos by root.
+
+Indexes are built lazily from db.list_photos, updated after each upload
+and kept for the DUPES_CACHE_USERS most recently used users. Indexes
+older than DUPES_TTL seconds are refreshed: photos uploaded or hashed by
+other worker processes are added to the existing index (photos are never
+deleted, so nothing has to be rebuilt). Builds and refreshes are
+single-flight per user, and each index has its own lock, so one large
+library never blocks other users.
+"""
+#------------------------------- imports -------------------------------------#
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import combinations
+
+import db
+import metrics
+
+
+# Upper bound on photos read when building one user's index.
+BUILD_LIMIT = 100000
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+_lock = threading.Lock()   # guards _indexes and _building; each index has its own lock
+_indexes = OrderedDict()   # user_id -> HashIndex, most recently used last
+_building = {}             # user_id -> threading.Event set when its build or refresh ends
+
+
+def max_distance():
+    return int(os.environ.get("DUPE_MAX_DISTANCE", "6"))
+
+
+def _ttl():
+    return float(os.environ.get("DUPES_TTL", "300"))
+
+
+# ---------------------------------------------------------------------------
+# Multi-index hash table
+# ---------------------------------------------------------------------------
+
+if hasattr(int, "bit_count"):   # Python 3.10+
+    _popcount = int.bit_count
+else:
+    def _popcount(x):
+        return bin(x).count("1")
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius):
+    """Every CHUNK_BITS-bit mask with at most radius bits set."""
+    return tuple(
+        sum(1 << b for b in bits)
+        for r in range(radius + 1)
+        for bits in combinations(range(CHUNK_BITS), r)
+    )
+
+
+class HashIndex:
+    """Multi-index hash table: CHUNKS dicts of chunk value -> set of hashes."""
+
+    def __init__(self, radius):
+        self.built_at = time.time()
+        self.radius = radius
+        self.lock = threading.Lock()
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.photos = {}   # hash -> [photo ids]
+        self.ids = set()   # every photo id indexed
+        # Union-find over hashes for clusters(); filled by link() after the
+        # bulk load and then kept up to date by add().
+        self.parent = None
+        self._groups = None   # cached clusters(), reset by add()
+
+    def add(self, hash_int, photo_id):
+        if photo_id in self.ids:
+            return
+        self.ids.add(photo_id)
+        self._groups = None
+        ids = self.photos.get(hash_int)
+        if ids is not None:
+            ids.append(photo_id)
+            return
+        self.photos[hash_int] = [photo_id]
+        for i, table in enumerate(self.tables):
+            chunk = (hash_int >> (i * CHUNK_BITS)) & CHUNK_MASK
+            table.setdefault(chunk, set()).add(hash_int)
+        if self.parent is not None:
+            for other in self._candidates(hash_int, self.radius):
+                if other != hash_int and _popcount(other ^ hash_int) <= self.radius:
+                    self._union(hash_int, other)
+
+    def _candidates(self, hash_int, radius):
+        masks = _flip_masks(radius // CHUNKS)
+        candidates = set()
+        for i, table in enumerate(self.tables):
+            chunk = (hash_int >> (i * CHUNK_BITS)) & CHUNK_MASK
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        return candidates
+
+    def search(self, hash_int, radius):
+        """Return [(distance, photo_id), ...] for every photo within radius."""
+        found = []
+        for candidate in self._candidates(hash_int, radius):
+            d = _popcount(candidate ^ hash_int)
+            if d <= radius:
+                found.extend((d, pid) for pid in self.photos[candidate])
+        return found
+
+    def _pairs(self):
+        """
+        Yield (hash_a, hash_b) for every pair of distinct hashes within
+        self.radius. Walks each table's buckets against their neighbour
+        buckets, which is much cheaper than one search per photo. A pair
+        may be yielded once per chunk it matches on.
+        """
+        masks = _flip_masks(self.radius // CHUNKS)
+        for table in self.tables:
+            for chunk, bucket in table.items():
+                for mask in masks:
+                    other = chunk ^ mask
+                    if other < chunk:
+                        continue   # visited from the other side
+                    neighbour = table.get(other)
+                    if not neighbour:
+                        continue
+                    for a in bucket:
+                        for b in neighbour:
+                            if (a < b or (mask and a != b)) and _popcount(a ^ b) <= self.radius:
+                                yield a, b
+
+    def _find(self, x):
+        parent = self.parent
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def _union(self, a, b):
+        self.parent[self._find(a)] = self._find(b)
+
+    def link(self):
+        """Union every pair within radius; run once after the bulk load."""
+        self.parent = {}
+        for a, b in self._pairs():
+            self._union(a, b)
+
+    def clusters(self):
+        """Return photo-id lists of every cluster with 2+ photos, largest first."""
+        if self.parent is None:
+            self.link()
+        if self._groups is None:
+            groups = {}
+            for hash_int, ids in self.photos.items():
+                root = self._find(hash_int) if hash_int in self.parent else hash_int
+                groups.setdefault(root, []).extend(ids)
+            self._groups = sorted((sorted(g) for g in groups.values() if len(g) > 1),
+                                  key=len, reverse=True)
+        return self._groups
+
+
+# ---------------------------------------------------------------------------
+# Per-user cache
+# ---------------------------------------------------------------------------
+
+def _hashed(user_id, skip=()):
+    """(hash, photo id) for the user's hashed photos whose id is not in skip."""
+    return [(int(p["phash"], 16), p["id"]) for p in db.list_photos(user_id, limit=BUILD_LIMIT)
+            if p.get("phash") and p["id"] not in skip]
+
+
+def _build(user_id):
+    index = HashIndex(max_distance())
+    for hash_int, photo_id in _hashed(user_id):
+        index.add(hash_int, photo_id)
+    index.link()   # not shared yet: no lock needed for the pair pass
+    metrics.inc("dupes_index_builds_total")
+    return index
+
+
+def _refresh(index, user_id):
+    """Add photos uploaded or hashed by other workers since index was built."""
+    new = _hashed(user_id, skip=index.ids)
+    with index.lock:
+        for hash_int, photo_id in new:
+            index.add(hash_int, photo_id)
+        index.built_at = time.time()
+    metrics.inc("dupes_index_refreshes_total")
+
+
+def _get_index(user_id):
+    key = str(user_id)
+    while True:
+        with _lock:
+            index = _indexes.get(key)
+            if index is not None and time.time() - index.built_at < _ttl():
+                _indexes.move_to_end(key)
+                return index
+            building = _building.get(key)
+            if building is None:
+                building = _building[key] = threading.Event()
+                break
+        if index is not None:
+            return index   # stale; another request is refreshing it
+        building.wait()   # then re-check: the build may have failed
+
+    # Outside _lock so one large library does not block the other users.
+    try:
+        if index is None:
+            index = _build(user_id)
+        else:
+            _refresh(index, user_id)
+        with _lock:
+            _indexes[key] = index
+            _indexes.move_to_end(key)
+            while len(_indexes) > int(os.environ.get("DUPES_CACHE_USERS", "100")):
+                _indexes.popitem(last=False)
+        return index
+    finally:
+        with _lock:
+            del _building[key]
+        building.set()
+
+
+def add_photo(user_id, photo_id, phash):
+    """Record a new upload in the user's index, if it is loaded."""
+    if not phash:
+        return
+    with _lock:
+        index = _indexes.get(str(user_id))
+    if index is not None:
+        with index.lock:
+            index.add(int(phash, 16), photo_id)
+
+
+def find_similar(user_id, phash, radius=None):
+    """Return [(distance, photo_id), ...] sorted nearest first."""
+    radius = max_distance() if radius is None else radius
+    index = _get_index(user_id)
+    with index.lock:
+        return sorted(index.search(int(phash, 16), radius))
+
+
+def clusters(user_id):
+    """
+    Group the user's photos into near-duplicate clusters (within
+    DUPE_MAX_DISTANCE bits). Returns a list of photo-id lists, only
+    clusters with 2+ photos, largest first.
+    """
+    index = _get_index(user_id)
+    with index.lock:
+        return index.clusters()
@@ -0,0 +1,132 @@
+"""
+Liveness and readiness probes.
+
+Load balancers hit the health endpoints every few seconds per instance,
+so the probes must not open connections or call the backends themselves.
+A background thread checks the active DB backend and S3 every
+HEALTH_INTERVAL seconds over the shared long-lived clients, and the
+readiness route serves the cached result together with its age.
+In dual-write mode the secondary backend is probed too, for /db-shadow;
+it is reported but does not affect readiness.
+"""
+#------------------------------- imports -------------------------------------#
+import os
+import threading
+import time
+
+import clients
+import db
+import metrics
+import resilience
+
+
+_lock = threading.Lock()
+_started = False
+_state = {"checked_at": None, "checks": {}}
+
+
+def interval():
+    return float(os.environ.get("HEALTH_INTERVAL", "10"))
+
+
+# ---------------------------------------------------------------------------
+# Individual checks
+# ---------------------------------------------------------------------------
+
+def _check_db():
+    db.ping()
+
+
+def _check_s3():
+    resilience.call("s3", clients.s3().head_bucket,
+                    Bucket=os.environ.get("S3_BUCKET", "assignment-1-images"))
+
+
+def _check_db_secondary():
+    db.ping_secondary()
+
+
+CHECKS = {
+    "db": _check_db,
+    "s3": _check_s3,
+}
+
+
+def _checks():
+    """CHECKS plus the informational ones for the active provider."""
+    if db.provider() == "dual":
+        return {**CHECKS, "db_secondary": _check_db_secondary}
+    return CHECKS
+
+
+# ---------------------------------------------------------------------------
+# Prober
+# ---------------------------------------------------------------------------
+
+def probe_once():
+    """Run every check once and cache the results."""
+    results = {}
+    for name, check in _checks().items():
+        start = time.perf_counter()
+        error = None
+        try:
+            check()
+        except Exception as e:
+            error = str(e)
+        elapsed = time.perf_counter() - start
+
+        metrics.observe("health_probe_seconds", elapsed, check=name)
+        metrics.set_gauge("health_check_up", 0 if error else 1, check=name)
+        results[name] = {
+            "ok": error is None,
+            "latency_ms": round(elapsed * 1000, 1),
+            "error": error,
+        }
+
+    with _lock:
+        _state["checked_at"] = time.time()
+        _state["checks"] = results
+
+
+def _loop():
+    while True:
+        probe_once()
+        time.sleep(interval())
+
+
+def start():
+    """Start the background prober (once per process)."""
+    global _started
+    if _started:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_loop, name="health-prober", daemon=True).start()
+
+
+def snapshot():
+    """
+    Return the cached probe result:
+    {"ready": bool, "age_seconds": float|None, "provider": str, "checks": {...}}
+
+    Not ready until the first probe has finished, if any check failed, or
+    if the result is older than three intervals (prober stuck).
+    """
+    with _lock:
+        checked_at = _state["checked_at"]
+        checks = dict(_state["checks"])
+
+    age = None if checked_at is None else round(time.time() - checked_at, 1)
+    ready = (
+        age is not None
+        and age <= 3 * interval()
+        and all(c["ok"] for name, c in checks.items() if name in CHECKS)
+    )
+    return {
+        "ready": ready,
+        "age_seconds": age,
+        "provider": db.provider(),
+        "checks": checks,
+    }
@@ -0,0 +1,71 @@
+"""
+Import-time profile and start-up regression check.
+
+Imports app.py in a fresh interpreter for each DB_PROVIDER with
+`python -X importtime`, prints the slowest imports and fails (exit 1) if
+
+- start-up takes longer than --max-ms, or
+- a heavy SDK (boto3, botocore, pymongo, pymysql, PIL) is imported at
+  start-up: db.py and clients.py are supposed to defer those until
+  first use.
+
+Usage (run from backend/, e.g. in CI before deploying):
+  python import_profile.py                 # all providers, default budget
+  python import_profile.py --providers mysql --max-ms 600 --top 25
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+LAZY_MODULES = ("boto3", "botocore", "pymongo", "pymysql", "PIL")
+
+
+def profile(provider):
+    """Return (total_us, [(cumulative_us, self_us, module), ...]) for `import app`."""
+    env = dict(os.environ, DB_PROVIDER=provider)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    total = next((cum for cum, _, name in rows if name.strip() == "app"), 0)
+    return total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--providers", default="mysql,dynamo,mongo,dual")
+    parser.add_argument("--max-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", "1000")))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    failures = []
+    for provider in args.providers.split(","):
+        total, rows = profile(provider)
+        print(f"\n=== DB_PROVIDER={provider}: import app took {total / 1000:.0f} ms ===")
+        print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+        for cumulative, self_us, name in sorted(rows, reverse=True)[:args.top]:
+            print(f"{cumulative / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}")
+
+        if total / 1000 > args.max_ms:
+            failures.append(f"{provider}: start-up {total / 1000:.0f} ms > budget {args.max_ms:.0f} ms")
+        eager = sorted({name.strip().split(".")[0] for _, _, name in rows} & set(LAZY_MODULES))
+        if eager:
+            failures.append(f"{provider}: imported at start-up: {', '.join(eager)}")
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
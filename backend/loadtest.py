@@ -0,0 +1,369 @@
+"""
+End-to-end load test for the Flask routes.
+
+Seeds synthetic users and photo libraries into the chosen backend, then
+drives mixed traffic (login, home, gallery, search, upload, download)
+against the app and reports throughput, latency percentiles and error
+rate for every (library size, concurrency) combination — one scaling
+curve per DB_PROVIDER.
+
+Stand-ins (no AWS account needed):
+  S3, DynamoDB  moto, in-process (unless AWS_ENDPOINT_URL points at a
+                moto server / MinIO / DynamoDB Local)
+  MongoDB       mongomock, in-process (unless MONGO_URI is set)
+  MySQL         a local server (e.g. docker run mysql:8) given by
+                DB_HOST / DB_USER / DB_PASS; schema.sql is applied first
+
+By default traffic goes through the real app (app.app, with all its
+request hooks) in process, one test client per virtual user thread.
+With --url it is sent over HTTP to a running server instead (e.g.
+gunicorn -w N app:app), which is how to compare worker counts. The
+server cannot see in-process stand-ins, so --url requires
+AWS_ENDPOINT_URL (and MONGO_URI for --provider mongo) pointing at the
+same services the server uses.
+
+Synthetic users send requests back to back, far above the per-user rate
+limits, so in-process runs default to ADMISSION_ENABLED=0; set it to 1
+to measure with admission control (and likewise on a --url server).
+
+Usage:
+  pip install -r requirements-loadtest.txt
+  python loadtest.py --provider dynamo --library-sizes 100,1000 \\
+      --concurrency 1,4,16 --duration 15 --csv results.csv
+"""
+import argparse
+import csv
+import http.cookiejar
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+
+WORDS = (
+    "sunset beach mountain lake city night portrait family dog cat forest "
+    "snow river bridge street market garden flower birthday wedding trip "
+    "summer winter autumn spring road desert island harbor skyline party"
+).split()
+
+# Default traffic mix (relative weights).
+MIX = {"home": 10, "gallery": 35, "search": 25, "download": 25, "upload": 5}
+
+PASSWORD = "loadtest-password"
+
+
+# ---------------------------------------------------------------------------
+# Stand-ins and seeding
+# ---------------------------------------------------------------------------
+
+def start_standins(provider):
+    """Start local stand-ins for S3 and the chosen backend. Call before importing db."""
+    os.environ["DB_PROVIDER"] = provider
+    os.environ.setdefault("S3_BUCKET", "loadtest-images")
+    os.environ.setdefault("S3_CACHE_DIR", tempfile.mkdtemp(prefix="loadtest-s3cache-"))
+
+    if not os.environ.get("AWS_ENDPOINT_URL"):
+        from moto import mock_aws
+        for var in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            os.environ.setdefault(var, "testing")
+        mock_aws().start()
+
+    import clients
+    s3 = clients.s3()
+    try:
+        s3.create_bucket(
+            Bucket=os.environ["S3_BUCKET"],
+            CreateBucketConfiguration={"LocationConstraint": clients.region()},
+        )
+    except s3.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    if provider == "dynamo":
+        _create_dynamo_tables(clients)
+    elif provider == "mongo" and not os.environ.get("MONGO_URI"):
+        import mongomock
+        import db_mongo
+        db_mongo._client = mongomock.MongoClient()
+        db_mongo._db = db_mongo._client["photo_gallery"]
+    elif provider == "mysql":
+        import init_db
+        init_db.main()
+
+
+def _create_dynamo_tables(clients):
+    ddb = clients.dynamodb()
+    specs = {
+        os.environ.get("DDB_USERS_TABLE", "users"): [("username", "S", "HASH")],
+        os.environ.get("DDB_PHOTOS_TABLE", "photos"): [("user_id", "S", "HASH"), ("id", "N", "RANGE")],
+    }
+    existing = set(ddb.meta.client.list_tables()["TableNames"])
+    for name, keys in specs.items():
+        if name in existing:
+            continue
+        ddb.create_table(
+            TableName=name,
+            KeySchema=[{"AttributeName": k, "KeyType": t} for k, _, t in keys],
+            AttributeDefinitions=[{"AttributeName": k, "AttributeType": a} for k, a, _ in keys],
+            BillingMode="PAY_PER_REQUEST",
+        ).wait_until_exists()
+
+
+def _jpeg(rnd, size=(320, 240)):
+    from PIL import Image
+    img = Image.new("RGB", size, tuple(rnd.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+def _title(rnd):
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4))).capitalize()
+
+
+def seed(users, photos_per_user, tag, rnd):
+    """
+    Create `users` users with `photos_per_user` photos each.
+    Returns [(username, [photo ids]), ...].
+    """
+    import clients
+    import db
+    from werkzeug.security import generate_password_hash
+
+    bucket = os.environ["S3_BUCKET"]
+    images = [_jpeg(rnd) for _ in range(8)]
+    password_hash = generate_password_hash(PASSWORD)
+    s3 = clients.s3()
+    seeded = []
+    for u in range(users):
+        username = f"lt{tag}-{u}-{uuid.uuid4().hex[:6]}"
+        db.create_user(username, None, password_hash)
+        user_id = db.get_user_by_username(username)["id"]
+        ids = []
+        last_ms = 0
+        for p in range(photos_per_user):
+            # Dynamo/Mongo photo ids are millisecond timestamps.
+            while int(time.time() * 1000) == last_ms:
+                time.sleep(0.0002)
+            last_ms = int(time.time() * 1000)
+            body = images[p % len(images)]
+            key = f"{user_id}/seed_{p}.jpg"
+            s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType="image/jpeg")
+            ids.append(db.add_photo(
+                user_id, bucket, key, f"seed_{p}.jpg",
+                title=_title(rnd),
+                tags=", ".join(rnd.sample(WORDS, 2)),
+                content_type="image/jpeg", size_bytes=len(body),
+            ))
+        seeded.append((username, ids))
+    return seeded
+
+
+# ---------------------------------------------------------------------------
+# Clients: in-process (app_routes) or HTTP
+# ---------------------------------------------------------------------------
+
+class AppClient:
+    """Drives the application (app.app) in process."""
+
+    def __init__(self):
+        from app import app   # imported once start_standins() has set up the stand-ins
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data, files=None):
+        if files:
+            data = dict(data)
+            for name, (filename, body, ctype) in files.items():
+                data[name] = (io.BytesIO(body), filename, ctype)
+        return self.client.post(path, data=data, content_type="multipart/form-data" if files else None).status_code
+
+
+class HttpClient:
+    """Drives a running server over HTTP, keeping the session cookie."""
+
+    def __init__(self, base_url):
+        self.base = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _send(self, req):
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self.base + path))
+
+    def post(self, path, data, files=None):
+        if not files:
+            body = urllib.parse.urlencode(data).encode()
+            return self._send(urllib.request.Request(self.base + path, data=body))
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in data.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, (filename, content, ctype) in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f"Content-Type: {ctype}\r\n\r\n".encode() + content + b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+        req = urllib.request.Request(self.base + path, data=b"".join(parts))
+        req.add_header("Content-Type", f"multipart/form-data; boundary={boundary}")
+        return self._send(req)
+
+
+# ---------------------------------------------------------------------------
+# Traffic
+# ---------------------------------------------------------------------------
+
+def _virtual_user(make_client, username, photo_ids, mix, deadline, rnd, upload_body, results):
+    client = make_client()
+    ops, weights = zip(*mix.items())
+
+    def timed(op, fn):
+        start = time.perf_counter()
+        try:
+            status = fn()
+        except Exception:
+            status = 599
+        results.append((op, time.perf_counter() - start, status >= 400))
+
+    timed("login", lambda: client.post("/login", {"username": username, "password": PASSWORD}))
+    while time.time() < deadline:
+        op = rnd.choices(ops, weights)[0]
+        if op == "home":
+            timed(op, lambda: client.get("/"))
+        elif op == "gallery":
+            timed(op, lambda: client.get("/gallery"))
+        elif op == "search":
+            q = urllib.parse.quote(rnd.choice(WORDS))
+            timed(op, lambda: client.get(f"/search?query={q}"))
+        elif op == "download" and photo_ids:
+            pid = rnd.choice(photo_ids)
+            timed(op, lambda: client.get(f"/download/{pid}"))
+        elif op == "upload":
+            timed(op, lambda: client.post(
+                "/upload", {"title": _title(rnd)},
+                files={"photo": (f"up_{rnd.randrange(10**9)}.jpg", upload_body, "image/jpeg")}))
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+def summarize(results, elapsed):
+    """Return {op: {...}} including an "all" row."""
+    by_op = {"all": results}
+    for r in results:
+        by_op.setdefault(r[0], []).append(r)
+    out = {}
+    for op, rows in by_op.items():
+        lat = sorted(r[1] for r in rows)
+        errors = sum(1 for r in rows if r[2])
+        out[op] = {
+            "requests": len(rows),
+            "rps": len(rows) / elapsed if elapsed else 0.0,
+            "error_rate": errors / len(rows) if rows else 0.0,
+            "p50_ms": _percentile(lat, 50) * 1000,
+            "p95_ms": _percentile(lat, 95) * 1000,
+            "p99_ms": _percentile(lat, 99) * 1000,
+        }
+    return out
+
+
+def run_level(make_client, seeded, concurrency, duration, mix, rnd):
+    upload_body = _jpeg(rnd)
+    results = []
+    deadline = time.time() + duration
+    threads = []
+    start = time.perf_counter()
+    for i in range(concurrency):
+        username, ids = seeded[i % len(seeded)]
+        t = threading.Thread(target=_virtual_user, args=(
+            make_client, username, ids, mix, deadline,
+            random.Random(rnd.random()), upload_body, results))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    return summarize(results, time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def _ints(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--provider", default=os.environ.get("DB_PROVIDER", "dynamo"),
+                        choices=["dynamo", "mongo", "mysql"])
+    parser.add_argument("--users", type=int, default=8, help="seeded users per library size")
+    parser.add_argument("--library-sizes", type=_ints, default=[100, 1000], help="photos per user, comma separated")
+    parser.add_argument("--concurrency", type=_ints, default=[1, 4, 16], help="virtual users, comma separated")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in MIX.items()),
+                        help="traffic weights, e.g. gallery=40,search=30,download=30")
+    parser.add_argument("--url", help="drive a running server instead of an in-process app")
+    parser.add_argument("--csv", help="append result rows to this CSV file")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+    if args.url:
+        # Seeding goes to the stand-ins; in-process ones are invisible to the server.
+        if not os.environ.get("AWS_ENDPOINT_URL"):
+            parser.error("--url needs AWS_ENDPOINT_URL (e.g. a moto server) shared with the server")
+        if args.provider == "mongo" and not os.environ.get("MONGO_URI"):
+            parser.error("--url with --provider mongo needs MONGO_URI shared with the server")
+    else:
+        os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+    mix = {k: float(v) for k, v in (pair.split("=") for pair in args.mix.split(","))}
+    rnd = random.Random(args.seed)
+
+    start_standins(args.provider)
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        make_client = AppClient
+
+    rows = []
+    print(f"{'provider':8} {'library':>7} {'conc':>4} {'op':9} {'reqs':>6} {'rps':>8} "
+          f"{'err%':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}")
+    for size in args.library_sizes:
+        seeded = seed(args.users, size, f"{size}", rnd)
+        for conc in args.concurrency:
+            summary = run_level(make_client, seeded, conc, args.duration, mix, rnd)
+            for op in ["all"] + sorted(k for k in summary if k != "all"):
+                s = summary[op]
+                print(f"{args.provider:8} {size:>7} {conc:>4} {op:9} {s['requests']:>6} {s['rps']:>8.1f} "
+                      f"{s['error_rate'] * 100:>6.2f} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+                rows.append(dict(provider=args.provider, library_size=size, concurrency=conc, op=op, **s))
+
+    if args.csv:
+        new = not os.path.exists(args.csv)
+        with open(args.csv, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            if new:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+In-process metrics registry.
+
+Counters, gauges and latency histograms are kept in memory and rendered
+in the Prometheus text format by the /metrics route. Each worker process
+keeps its own registry, so scrape every worker (or sum at the collector).
+"""
+#------------------------------- imports -------------------------------------#
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Latency buckets in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def inc(name, amount=1, **labels):
+    """Add amount to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """Record one latency sample (in seconds) in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Context manager: observe the wall time of the block."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def value(name, **labels):
+    """Current value of a counter or gauge (0 if never recorded)."""
+    key = _key(name, labels)
+    with _lock:
+        if key in _gauges:
+            return _gauges[key]
+        return _counters.get(key, 0)
+
+
+# ---------------------------------------------------------------------------
+# Prometheus text rendering
+# ---------------------------------------------------------------------------
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((k, dict(v, buckets=list(v["buckets"]))) for k, v in _histograms.items())
+
+    typed = set()
+    for kind, series in (("counter", counters), ("gauge", gauges)):
+        for (name, labels), val in series:
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+            lines.append(f"{name}{_fmt_labels(labels)} {val}")
+
+    for (name, labels), hist in histograms:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        for bound, count in zip(BUCKETS, hist["buckets"]):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {hist['count']}")
+
+    return "\n".join(lines) + "\n"
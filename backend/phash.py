@@ -0,0 +1,112 @@
+"""
+Perceptual hashing for near-duplicate detection.
+
+Uses a 64-bit difference hash (dHash): the image is shrunk to 9x8
+grayscale and each bit records whether a pixel is brighter than its right
+neighbour. Resized or recompressed copies of the same shot land within a
+few bits of each other.
+
+Decoding and resizing is CPU-bound, so hashes are computed in a process
+pool (PHASH_WORKERS, default: CPU count) instead of on the request thread.
+If a worker dies (e.g. out of memory on a huge image) the pool is broken
+for good, so it is discarded and a fresh one started on the next call.
+Failures are logged and counted as phash_failures_total{reason}.
+Hashes are stored as 16-character hex strings so they fit every backend
+(BSON has no unsigned 64-bit integer).
+"""
+#------------------------------- imports -------------------------------------#
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pool = None
+
+
+def dhash(data):
+    """Return the dHash of encoded image bytes as a hex string. Runs in a worker process."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (64, 64))   # let JPEG decode at reduced size
+        small = img.convert("L").resize((9, 8), Image.LANCZOS)
+        pixels = list(small.getdata())
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def pool():
+    """Return the process-wide hashing pool, starting it on first use."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                workers = int(os.environ.get("PHASH_WORKERS", "0")) or os.cpu_count()
+                _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def _discard(broken):
+    """Drop a pool whose worker died so the next call starts a fresh one."""
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(data):
+    """Return (pool, future) for dhash(data), replacing a pool an earlier task broke."""
+    executor = pool()
+    try:
+        return executor, executor.submit(dhash, data)
+    except BrokenProcessPool:
+        _discard(executor)
+        executor = pool()
+        return executor, executor.submit(dhash, data)
+
+
+def submit(data):
+    """Queue dhash(data) on the pool; returns a Future (used by backfill_phash.py)."""
+    return _submit(data)[1]
+
+
+def compute(data, timeout=10):
+    """
+    Hash image bytes in the worker pool.
+    Returns the hex hash, or None if hashing failed (not a decodable
+    image, timed out, or the worker died).
+    """
+    executor, future = _submit(data)
+    try:
+        return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        _discard(executor)
+        reason = "worker_died"
+    except FutureTimeout:
+        reason = "timeout"
+    except Exception:
+        reason = "decode"
+    metrics.inc("phash_failures_total", reason=reason)
+    log.warning("perceptual hash failed (%s)", reason, exc_info=reason == "decode")
+    return None
+
+
+def distance(a, b):
+    """Hamming distance between two hex hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
@@ -0,0 +1,348 @@
+"""
+On-demand sampling profiler for individual requests.
+
+A request is profiled when
+
+- it carries `X-Profile: <PROFILE_TOKEN>`, or
+- it is picked by the global sampling fraction PROFILE_SAMPLE
+  (e.g. 0.01 for continuous background profiling of 1% of requests).
+
+While a request is profiled, a sampler thread records the request
+thread's Python stack every PROFILE_INTERVAL_MS. Stacks are annotated
+with spans: every S3 and database call (entered in resilience.call) and
+every template render shows up as a "[kind] name" frame at the point
+where it was entered, so time spent waiting on a dependency is visible
+in the flame graph.
+
+Profiles are written to PROFILE_DIR (the newest PROFILE_KEEP are kept)
+in the collapsed-stack format read by flamegraph.pl, speedscope and
+most flame graph tools, and can be fetched by request id from
+/profiles/<id> (token required, in the X-Profile header). Profiled
+responses carry the id in X-Request-ID. A client-supplied X-Request-ID
+is reused only on requests profiled by token; sampled requests always
+get a server-generated id.
+
+When no request is being profiled there is no sampler thread; the cost
+is one header lookup per request and a thread-local check per span.
+"""
+#------------------------------- imports -------------------------------------#
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request
+from jinja2 import Template
+
+
+HEADER = "X-Profile"
+ID_HEADER = "X-Request-ID"
+_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def token():
+    return os.environ.get("PROFILE_TOKEN", "")
+
+
+def sample_rate():
+    return float(os.environ.get("PROFILE_SAMPLE", "0"))
+
+
+def interval():
+    return float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+
+
+def profile_dir():
+    return os.environ.get("PROFILE_DIR", "/tmp/photo-profiles")
+
+
+def keep():
+    return int(os.environ.get("PROFILE_KEEP", "200"))
+
+
+def authorized(value):
+    """True if value matches PROFILE_TOKEN (which must be set)."""
+    expected = token()
+    return bool(expected) and value is not None and hmac.compare_digest(value, expected)
+
+
+# ---------------------------------------------------------------------------
+# Profiles and spans
+# ---------------------------------------------------------------------------
+
+def _depth(frame):
+    n = 0
+    while frame is not None:
+        n += 1
+        frame = frame.f_back
+    return n
+
+
+class Profile:
+    """Samples and spans collected for one request."""
+
+    def __init__(self, request_id, method, path, trigger):
+        self.id = request_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.samples = Counter()   # tuple of frame labels -> count
+        self.open_spans = []       # [(depth, label)] currently entered, outermost first
+        self.spans = []            # finished: (kind, name, offset, seconds)
+
+    def sample(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        # Insert span markers just below the frame that entered them.
+        for shift, (depth, label) in enumerate(tuple(self.open_spans)):
+            if depth + shift <= len(stack):
+                stack.insert(depth + shift, label)
+        self.samples[tuple(stack)] += 1
+
+    def folded(self):
+        """Collapsed stacks: "frame;frame;frame count" per line."""
+        root = f"{self.method} {self.path}".replace(";", ",")
+        lines = [";".join((root,) + tuple(f.replace(";", ",") for f in stack)) + f" {count}"
+                 for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        by_kind = {}
+        for kind, _, _, seconds in self.spans:
+            by_kind[kind] = round(by_kind.get(kind, 0.0) + seconds * 1000, 2)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started": self.started,
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+            "interval_ms": interval() * 1000,
+            "samples": sum(self.samples.values()),
+            "span_ms": by_kind,
+            "spans": [{"kind": k, "name": n, "offset_ms": round(o * 1000, 2), "ms": round(s * 1000, 2)}
+                      for k, n, o, s in self.spans],
+        }
+
+
+class _State(threading.local):
+    profile = None   # class default: no AttributeError on the fast path
+
+
+_local = _State()
+
+
+class _Span:
+    __slots__ = ("profile", "kind", "name", "start")
+
+    def __init__(self, profile, kind, name):
+        self.profile, self.kind, self.name = profile, kind, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        depth = _depth(sys._getframe(1))
+        self.profile.open_spans.append((depth, f"[{self.kind}] {self.name}"))
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.open_spans.pop()
+        end = time.perf_counter()
+        self.profile.spans.append((self.kind, self.name, self.start - self.profile.start, end - self.start))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(kind, name):
+    """Context manager marking a db / s3 / template span in the current profile, if any."""
+    profile = _local.profile
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, kind, name)
+
+
+class ProfiledTemplate(Template):
+    """Jinja template class that records a "template" span around render()."""
+
+    def render(self, *args, **kwargs):
+        with span("template", self.name):
+            return super().render(*args, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Sampler thread (runs only while some request is profiled)
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_active = {}        # thread id -> Profile
+_sampler = None
+
+
+def _run_sampler():
+    global _sampler
+    while True:
+        # Sample under the lock so end() never reads a profile mid-sample.
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            frames = sys._current_frames()
+            for thread_id, profile in _active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.sample(frame)
+            del frames, frame
+        time.sleep(interval())
+
+
+def _start(profile):
+    global _sampler
+    with _lock:
+        _active[threading.get_ident()] = profile
+        if _sampler is None:
+            _sampler = threading.Thread(target=_run_sampler, name="profiler", daemon=True)
+            _sampler.start()
+
+
+def _stop():
+    with _lock:
+        _active.pop(threading.get_ident(), None)
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+def _path(request_id, ext):
+    return os.path.join(profile_dir(), f"{request_id}.{ext}")
+
+
+def _save(profile):
+    os.makedirs(profile_dir(), exist_ok=True)
+    for ext, data in (("folded", profile.folded()), ("json", json.dumps(profile.summary()))):
+        tmp = _path(profile.id, ext) + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, _path(profile.id, ext))
+    _prune()
+
+
+def _prune():
+    try:
+        names = [n for n in os.listdir(profile_dir()) if n.endswith(".json")]
+    except FileNotFoundError:
+        return
+    if len(names) <= keep():
+        return
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(profile_dir(), n)))
+    for name in names[:len(names) - keep()]:
+        request_id = name[:-len(".json")]
+        for ext in ("json", "folded"):
+            try:
+                os.remove(_path(request_id, ext))
+            except FileNotFoundError:
+                pass
+
+
+def load(request_id, fmt="folded"):
+    """Stored profile for request_id (collapsed stacks, or the JSON summary), or None."""
+    if not _ID_RE.match(request_id):
+        return None
+    try:
+        with open(_path(request_id, "json" if fmt == "json" else "folded")) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def recent(limit=50):
+    """Summaries of the newest stored profiles, newest first."""
+    try:
+        names = [n for n in os.listdir(profile_dir()) if n.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    paths = sorted((os.path.join(profile_dir(), n) for n in names), key=os.path.getmtime, reverse=True)
+    out = []
+    for path in paths[:limit]:
+        try:
+            with open(path) as f:
+                summary = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        summary.pop("spans", None)
+        out.append(summary)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Request hooks
+# ---------------------------------------------------------------------------
+
+def begin():
+    """before_request hook: start profiling this request if asked to or sampled."""
+    header = request.headers.get(HEADER)
+    if header is not None and authorized(header):
+        trigger = "header"
+    else:
+        rate = sample_rate()
+        if not rate or random.random() >= rate:
+            return
+        trigger = "sample"
+    # Only a token holder may name the profile; anyone else could pick an
+    # id to overwrite another stored profile.
+    request_id = request.headers.get(ID_HEADER, "") if trigger == "header" else ""
+    if not _ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    profile = g.profile = _local.profile = Profile(request_id, request.method, request.path, trigger)
+    _start(profile)
+
+
+def tag_response(response):
+    """after_request hook: tell the client which id to fetch."""
+    profile = g.get("profile")
+    if profile is not None:
+        response.headers[ID_HEADER] = profile.id
+    return response
+
+
+def end(exc=None):
+    """teardown_request hook: stop sampling and store the profile."""
+    profile = g.pop("profile", None)
+    if profile is None:
+        return
+    _stop()
+    _local.profile = None
+    profile.duration = time.perf_counter() - profile.start
+    _save(profile)
+
+
+def init_app(app):
+    """Register the hooks and the template span on app."""
+    app.before_request(begin)
+    app.after_request(tag_response)
+    app.teardown_request(end)
+    app.jinja_env.template_class = ProfiledTemplate
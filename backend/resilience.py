@@ -0,0 +1,333 @@
+"""
+Deadlines, retries and circuit breakers for S3 and database calls.
+
+Every call to a dependency (s3, dynamodb, mongo, mysql) goes through
+guarded() / call():
+
+- Deadline. Each request gets REQUEST_BUDGET seconds (set in a
+  before_request hook). A call attempt gets DEPENDENCY_TIMEOUT seconds or
+  whatever is left of the budget, whichever is less; attempt_timeout()
+  exposes that to the backends so they can pass it to the driver
+  (get_conn in db_mysql, pymongo.timeout, the boto3 before-send hook in
+  clients.py, the S3 body reads in s3cache). No attempt starts once the
+  budget is spent.
+- Retries. Idempotent operations are retried on transient errors
+  (connection failures, timeouts, throttling, 5xx) up to RETRY_ATTEMPTS
+  times with exponential backoff and full jitter, never past the
+  deadline. Non-idempotent writes are tried once.
+- Circuit breaker, one per dependency. After BREAKER_FAILURES
+  consecutive transient failures the breaker opens and calls fail
+  immediately for BREAKER_COOLDOWN seconds; then a single trial call is
+  let through (half-open) and its outcome closes or re-opens the breaker.
+  Worker threads are not tied up waiting on a dependency that is down.
+
+Failures that end a call early raise Unavailable, which app.py turns
+into a 503 with Retry-After. Errors that are not transient (not found,
+conditional check failed, duplicate key, ...) pass through unchanged and
+do not count against the breaker.
+
+Metrics: circuit_breaker_state{dependency} (0 closed, 1 half-open,
+2 open), circuit_breaker_opened_total, circuit_breaker_rejected_total,
+dependency_retries_total, dependency_failures_total and
+deadline_exceeded_total.
+
+Exceptions are classified by class name so this module does not import
+boto3, pymongo or pymysql.
+"""
+#------------------------------- imports -------------------------------------#
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+from flask import Response, request
+
+import metrics
+import profiler
+
+
+log = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half-open", OPEN: "open"}
+
+# Exception classes (by name, anywhere in the MRO) that mean "try again".
+TRANSIENT_CLASSES = {
+    # builtins
+    "TimeoutError", "ConnectionError",
+    # botocore
+    "EndpointConnectionError", "ConnectTimeoutError", "ReadTimeoutError",
+    "ConnectionClosedError", "HTTPClientError", "ResponseStreamingError",
+    # pymongo (NetworkTimeout and ServerSelectionTimeoutError subclass AutoReconnect)
+    "AutoReconnect", "ExecutionTimeout", "WTimeoutError",
+    # pymysql
+    "InterfaceError",
+}
+# botocore ClientError codes that mean "try again".
+TRANSIENT_CODES = {
+    "Throttling", "ThrottlingException", "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded", "TooManyRequestsException", "SlowDown",
+    "InternalError", "InternalServerError", "ServiceUnavailable", "RequestTimeout",
+    "TransactionConflictException",
+}
+# pymysql OperationalError codes that mean "try again": can't connect,
+# server gone away, lost connection, lock wait timeout, deadlock.
+TRANSIENT_MYSQL_CODES = {2003, 2006, 2013, 1205, 1213}
+
+
+def request_budget():
+    return float(os.environ.get("REQUEST_BUDGET", "10"))
+
+
+def dependency_timeout():
+    return float(os.environ.get("DEPENDENCY_TIMEOUT", "5"))
+
+
+def retry_attempts():
+    return int(os.environ.get("RETRY_ATTEMPTS", "3"))
+
+
+def retry_base_delay():
+    return float(os.environ.get("RETRY_BASE_DELAY", "0.05"))
+
+
+def retry_max_delay():
+    return float(os.environ.get("RETRY_MAX_DELAY", "1.0"))
+
+
+def breaker_failures():
+    return int(os.environ.get("BREAKER_FAILURES", "5"))
+
+
+def breaker_cooldown():
+    return float(os.environ.get("BREAKER_COOLDOWN", "15"))
+
+
+class Unavailable(Exception):
+    """A dependency is failing or the request ran out of time; try again later."""
+
+    def __init__(self, dependency, reason, retry_after=1):
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.retry_after = max(1, int(retry_after))
+
+
+# ---------------------------------------------------------------------------
+# Request budget
+# ---------------------------------------------------------------------------
+
+_local = threading.local()
+
+
+def begin_request():
+    """before_request hook: start this request's time budget."""
+    _local.deadline = time.monotonic() + request_budget()
+
+
+def end_request(exc=None):
+    """teardown_request hook."""
+    _local.deadline = None
+
+
+def remaining():
+    """Seconds left in the current request's budget, or None outside a request."""
+    deadline = getattr(_local, "deadline", None)
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def attempt_timeout():
+    """Timeout for the call attempt in progress (or the next one)."""
+    left = remaining()
+    timeout = dependency_timeout()
+    return timeout if left is None else max(0.001, min(timeout, left))
+
+
+# ---------------------------------------------------------------------------
+# Circuit breakers
+# ---------------------------------------------------------------------------
+
+class Breaker:
+    """Consecutive-failure circuit breaker for one dependency."""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False    # a half-open trial call is in flight
+        self._lock = threading.Lock()
+        self._export()
+
+    def _export(self):
+        metrics.set_gauge("circuit_breaker_state", self.state, dependency=self.name)
+
+    def _set(self, state):
+        if state != self.state:
+            log.warning("circuit breaker %s: %s -> %s", self.name,
+                        STATE_NAMES[self.state], STATE_NAMES[state])
+            self.state = state
+            self._export()
+
+    def allow(self):
+        """Return True if a call may proceed; False means fail fast."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < breaker_cooldown():
+                    return False
+                self._set(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.trial:
+                    return False
+                self.trial = True
+            return True
+
+    def retry_after(self):
+        return max(1, breaker_cooldown() - (time.monotonic() - self.opened_at))
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.trial = False
+            self._set(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial = False
+            if self.state == HALF_OPEN or self.failures >= breaker_failures():
+                self.opened_at = time.monotonic()
+                if self.state != OPEN:
+                    metrics.inc("circuit_breaker_opened_total", dependency=self.name)
+                self._set(OPEN)
+
+    def release(self):
+        """The call ended without saying anything about the dependency's health."""
+        with self._lock:
+            self.trial = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(dependency):
+    b = _breakers.get(dependency)
+    if b is None:
+        with _breakers_lock:
+            b = _breakers.get(dependency)
+            if b is None:
+                b = _breakers[dependency] = Breaker(dependency)
+    return b
+
+
+def states():
+    """{dependency: "closed" | "half-open" | "open"} for every breaker seen so far."""
+    return {name: STATE_NAMES[b.state] for name, b in sorted(_breakers.items())}
+
+
+# ---------------------------------------------------------------------------
+# Calls
+# ---------------------------------------------------------------------------
+
+def is_transient(exc):
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & TRANSIENT_CLASSES:
+        return True
+    if "ClientError" in names:   # botocore
+        response = getattr(exc, "response", None) or {}
+        code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return code in TRANSIENT_CODES or status >= 500
+    if "OperationalError" in names and type(exc).__module__.startswith("pymysql"):
+        return bool(exc.args) and exc.args[0] in TRANSIENT_MYSQL_CODES
+    if "PyMongoError" in names:
+        return exc.has_error_label("RetryableWriteError")
+    return False
+
+
+def backoff(attempt):
+    """Full jitter: uniform in [0, min(max_delay, base * 2**attempt)]."""
+    return random.uniform(0, min(retry_max_delay(), retry_base_delay() * 2 ** attempt))
+
+
+def call(dependency, fn, *args, idempotent=False, scope=None, **kwargs):
+    """
+    Call fn(*args, **kwargs) against dependency with the breaker, deadline
+    and (for idempotent operations) retries. scope, if given, is called
+    with the attempt timeout and must return a context manager wrapped
+    around each attempt (e.g. pymongo.timeout).
+    """
+    # A guarded function calling another one for the same dependency
+    # (search_photos -> list_photos) runs inside the outer call's policy.
+    if getattr(_local, "active", None) == dependency:
+        return fn(*args, **kwargs)
+    with profiler.span(dependency, getattr(fn, "__name__", "call")):
+        return _attempts(dependency, fn, args, kwargs, idempotent, scope)
+
+
+def _attempts(dependency, fn, args, kwargs, idempotent, scope):
+    b = breaker(dependency)
+    attempts = retry_attempts() if idempotent else 1
+    for attempt in range(attempts):
+        left = remaining()
+        if left is not None and left <= 0:
+            metrics.inc("deadline_exceeded_total", dependency=dependency)
+            raise Unavailable(dependency, "request deadline exceeded")
+        if not b.allow():
+            metrics.inc("circuit_breaker_rejected_total", dependency=dependency)
+            raise Unavailable(dependency, "circuit open", b.retry_after())
+
+        _local.active = dependency
+        try:
+            with scope(attempt_timeout()) if scope else nullcontext():
+                result = fn(*args, **kwargs)
+        except Unavailable:
+            b.release()
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                # The dependency answered (not found, duplicate key, ...): it is up.
+                b.success()
+                raise
+            b.failure()
+            metrics.inc("dependency_failures_total", dependency=dependency)
+            delay = backoff(attempt)
+            left = remaining()
+            if attempt + 1 >= attempts or (left is not None and delay >= left):
+                raise Unavailable(dependency, f"{type(e).__name__}: {e}") from e
+            metrics.inc("dependency_retries_total", dependency=dependency)
+            time.sleep(delay)
+        except BaseException:
+            b.release()
+            raise
+        else:
+            b.success()
+            return result
+        finally:
+            _local.active = None
+
+
+def guarded(dependency, idempotent=False, scope=None):
+    """Decorator form of call()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            return call(dependency, fn, *args, idempotent=idempotent, scope=scope, **kwargs)
+        return wrapped
+    return decorate
+
+
+def error_response(e):
+    """
+    Flask error handler for Unavailable: 503 with Retry-After. The cause
+    (which may include driver error text) is logged, not sent to the client.
+    """
+    metrics.inc("dependency_unavailable_total", dependency=e.dependency)
+    log.warning("503 for %s %s: %s", request.method, request.path, e, exc_info=e.__cause__ is not None)
+    resp = Response("Service temporarily unavailable. Please retry.\n",
+                    status=503, mimetype="text/plain")
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
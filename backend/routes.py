@@ -7,10 +7,21 @@ Each route uses db.py for database access; photo routes will also use S3.
 #------------------------------- imports -------------------------------------#
 import os
 import time
+from functools import partial
 
-import boto3
+import api
+import clients
 import db
-from flask import redirect, request, Response, session, url_for, render_template
+import dupes
+import export
+import health
+import metrics
+import phash
+import profiler
+import resilience
+import s3cache
+import suggest
+from flask import jsonify, redirect, request, Response, send_file, session, stream_with_context, url_for, render_template
 from werkzeug.security import check_password_hash, generate_password_hash
 from auth import login_required
 
@@ -26,8 +37,7 @@ def home():
     """Serve the home page. Logged in: greeting and Log out. Not logged in: Welcome with Sign up or Log in."""
     bucket = os.environ.get("S3_BUCKET", "assignment-1-images")
     if session.get("user_id"):
-        photos = db.list_photos(session["user_id"])
-        return render_template("index.html", photos=photos, S3_BUCKET=bucket)
+        return _render_gallery(session["user_id"], bucket)
     # Change "home.html" to "login.html" if you want them to log in first
     return render_template("login.html")
     
@@ -36,35 +46,78 @@ def home():
 
 def db_check():
     """
-    Check database connectivity based on DB_PROVIDER.
-    Supports: dynamo, mongo, mysql (legacy Project 1).
+    Report database connectivity for DB_PROVIDER (dynamo, mongo, mysql).
+    Served from the background prober's cached result — never opens a
+    connection per hit.
     """
-    try:
-        import os
-        provider = os.environ.get("DB_PROVIDER", "mysql")
-
-        if provider == "dynamo":
-            import boto3
-            region = os.environ.get("AWS_REGION", "us-east-2")
-            ddb = boto3.client("dynamodb", region_name=region)
-            ddb.list_tables()
-            return "DynamoDB connection successful."
-
-        elif provider == "mongo":
-            from pymongo import MongoClient
-            client = MongoClient(os.environ.get("MONGO_URI"))
-            client.admin.command("ping")
-            return "MongoDB connection successful."
-
-        else:
-            # Legacy MySQL (Project 1)
-            with db.get_conn() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT 1")
-            return "MySQL connection successful."
+    state = health.snapshot()
+    check = state["checks"].get("db")
+    if check is None:
+        return "DB check pending.", 503
+    if not check["ok"]:
+        return f"DB connection failed: {check['error']}", 500
+    name = {"dynamo": "DynamoDB", "mongo": "MongoDB", "dual": "Dual-write"}.get(state["provider"], "MySQL")
+    return f"{name} connection successful ({state['age_seconds']}s ago)."
 
-    except Exception as e:
-        return f"DB connection failed: {e}", 500
+
+def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return "ok"
+
+
+def readiness():
+    """Readiness probe: cached backend + S3 checks with their age; 503 if not ready."""
+    state = health.snapshot()
+    return jsonify(state), 200 if state["ready"] else 503
+
+
+def db_shadow():
+    """
+    Dual-write mode only: per-function latency of both backends, shadow-read
+    mismatches and the prober's last view of the secondary. Requires the
+    profiling token.
+    """
+    if not _profile_auth():
+        return "Not found.", 404
+    if db.provider() != "dual":
+        return "Not in dual-write mode (DB_PROVIDER=dual).", 404
+    report = db.shadow_report()
+    state = health.snapshot()
+    check = state["checks"].get("db_secondary")
+    report["secondary_health"] = None if check is None else {
+        "up": check["ok"], "ping_ms": check["latency_ms"], "age_seconds": state["age_seconds"],
+    }
+    return jsonify(report)
+
+
+def _profile_auth():
+    return profiler.authorized(request.headers.get(profiler.HEADER))
+
+
+def profiles():
+    """Newest stored request profiles (JSON). Requires the profiling token."""
+    if not _profile_auth():
+        return "Not found.", 404
+    return jsonify(profiler.recent())
+
+
+def profile_view(request_id):
+    """
+    One request's profile: collapsed stacks for flamegraph.pl / speedscope,
+    or ?format=json for the span timings. Requires the profiling token.
+    """
+    if not _profile_auth():
+        return "Not found.", 404
+    fmt = request.args.get("format", "folded")
+    data = profiler.load(request_id, fmt)
+    if data is None:
+        return "No profile with that id on this instance.", 404
+    return Response(data, mimetype="application/json" if fmt == "json" else "text/plain")
+
+
+def metrics_view():
+    """Expose in-process metrics in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 # ---------------------------------------------------------------------------
 # Auth routes (login, logout)
@@ -191,10 +244,18 @@ def upload():
     # body = photo.read()
     # size_bytes = len(body)
 
+    body = photo.read()
+    phash_hex = phash.compute(body)
+
     try:
-        s3 = boto3.client("s3", region_name=os.environ.get("AWS_REGION", "us-east-2"))
-        s3.put_object(Bucket=bucket, Key=key, Body=photo.read(), ContentType=photo.content_type)
-        db.add_photo(user_id, bucket, key, photo.filename, title=title)
+        # Keys are unique per upload, so retrying the PUT is safe.
+        resilience.call("s3", clients.s3().put_object, idempotent=True,
+                        Bucket=bucket, Key=key, Body=body, ContentType=photo.content_type)
+        photo_id = db.add_photo(user_id, bucket, key, photo.filename, title=title, phash=phash_hex)
+        suggest.add_photo(user_id, title=title)
+        dupes.add_photo(user_id, photo_id, phash_hex)
+    except resilience.Unavailable:
+        raise   # 503 + Retry-After (app.py)
     except Exception as e:
         return f"Upload failed: {e}", 500
 
@@ -247,9 +308,7 @@ def gallery():
     """List the current user's photos with download links."""
 
     bucket = os.environ.get("S3_BUCKET", "assignment-1-images")
-    photos = db.list_photos(session["user_id"])
-    print(photos)
-    return render_template("index.html", photos=photos, S3_BUCKET=bucket)
+    return _render_gallery(session["user_id"], bucket)
 
     # user_id = session["user_id"]
     # photos = db.list_photos(user_id)
@@ -268,6 +327,40 @@ def gallery():
     # return "\n".join(lines)
 
 
+def _render_gallery(user_id, bucket):
+    """Render the first page of the gallery; later pages come from /api/photos."""
+    photos, before = api.fetch_page(partial(db.list_photos, user_id), api.page_size())
+    next_url = url_for("api_photos", before=before) if before is not None else None
+    return render_template("index.html", photos=photos, S3_BUCKET=bucket, next_url=next_url)
+
+
+@login_required
+def api_photos():
+    """JSON page of the gallery (?before=<last id>) for infinite scroll."""
+    user_id = session["user_id"]
+    before, size = api.parse_page()
+    photos, next_before = api.fetch_page(partial(db.list_photos, user_id), size, before)
+    return api.json_response({
+        "photos": [api.compact(p) for p in photos],
+        "next": url_for("api_photos", before=next_before, size=size) if next_before is not None else None,
+    })
+
+
+@login_required
+def api_search():
+    """JSON page of search results (?query=...&before=<last id>) for infinite scroll."""
+    user_id = session["user_id"]
+    q = request.args.get("query", "").strip()
+    before, size = api.parse_page()
+    photos, next_before = [], None
+    if q:
+        photos, next_before = api.fetch_page(partial(db.search_photos, user_id, q), size, before)
+    return api.json_response({
+        "photos": [api.compact(p) for p in photos],
+        "next": url_for("api_search", query=q, before=next_before, size=size) if next_before is not None else None,
+    })
+
+
 @login_required
 def search():
     """Search photos by title, description, or tags; show results with download links."""
@@ -276,9 +369,13 @@ def search():
     # Change 'q' to 'query' to match your HTML input name
     q = request.args.get("query", "").strip() 
     bucket = os.environ.get("S3_BUCKET", "assignment-1-images")
-    photos = db.search_photos(user_id, q=q) if q else []
+    photos, before = [], None
+    if q:
+        # First page only; the rest is loaded by infinite scroll from /api/search.
+        photos, before = api.fetch_page(partial(db.search_photos, user_id, q), api.page_size())
+    next_url = url_for("api_search", query=q, before=before) if before is not None else None
     # Ensure query=q is passed so the "Showing search results for..." text works
-    return render_template("search.html", photos=photos, query=q, S3_BUCKET=bucket)
+    return render_template("search.html", photos=photos, query=q, S3_BUCKET=bucket, next_url=next_url)
 
 
 
@@ -320,6 +417,66 @@ def search():
     # return "\n".join(lines)
 
 
+@login_required
+def autocomplete():
+    """JSON title and tag suggestions for the search box, served from the in-memory prefix index."""
+    q = request.args.get("q", "")
+    return jsonify(suggest.suggest(session["user_id"], q))
+
+
+@login_required
+def duplicates():
+    """JSON list of near-duplicate clusters in the current user's library."""
+    user_id = session["user_id"]
+    groups = dupes.clusters(user_id)
+    # Titles for the clustered photos only, in one batched read.
+    photos = {p["id"]: p for p in db.get_photos(user_id, [pid for group in groups for pid in group])}
+    return jsonify({
+        "max_distance": dupes.max_distance(),
+        "clusters": [
+            [
+                {"id": pid, "title": photos.get(pid, {}).get("title") or photos.get(pid, {}).get("original_name")}
+                for pid in group
+            ]
+            for group in groups
+        ],
+    })
+
+
+def _parse_ids(values):
+    """Photo ids from "1,2,3" strings and/or repeated parameters, in order."""
+    return [int(i) for part in values for i in part.split(",") if i.strip().isdigit()]
+
+
+@login_required
+def photo_detail(photo_id):
+    """
+    One photo with previous/next links. ?ids= carries the ordered ids of
+    the gallery or search page it was opened from; the photo and both
+    neighbours are loaded with a single db.get_photos call and the
+    neighbours' images are prefetched.
+    """
+    user_id = session["user_id"]
+    bucket = os.environ.get("S3_BUCKET", "assignment-1-images")
+    ids = _parse_ids(request.args.getlist("ids"))[:api.MAX_PAGE_SIZE]
+
+    prev_id = next_id = None
+    if photo_id in ids:
+        i = ids.index(photo_id)
+        prev_id = ids[i - 1] if i > 0 else None
+        next_id = ids[i + 1] if i + 1 < len(ids) else None
+    wanted = [i for i in (photo_id, prev_id, next_id) if i is not None]
+    photos = {p["id"]: p for p in db.get_photos(user_id, wanted)}
+
+    photo = photos.get(photo_id)
+    if not photo:
+        return "Not found.", 404
+    tags = [t.strip() for t in (photo.get("tags") or "").split(",") if t.strip()]
+    return render_template("photodetail.html", photo=photo, tags=tags, S3_BUCKET=bucket,
+                           prev=photos.get(prev_id), next=photos.get(next_id),
+                           ids=",".join(map(str, ids)))
+
+
 @login_required
 def download(photo_id):
     """Stream the photo from S3 so the user can download it."""
@@ -331,24 +488,47 @@ def download(photo_id):
         return "Not found.", 404
         
     try:
-        s3 = boto3.client("s3", region_name=os.environ.get("AWS_REGION", "us-east-2"))
-        obj = s3.get_object(Bucket=photo["s3_bucket"], Key=photo["s3_key"])
-        body = obj["Body"].read()
-        
+        # Served from the on-instance cache; only misses go to S3.
+        f = s3cache.open_object(photo["s3_bucket"], photo["s3_key"])
+
         content_type = photo.get("content_type") or "application/octet-stream"
         filename = photo.get("original_name") or "photo"
-        
-        resp = Response(body, content_type=content_type)
-        resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-        
+
+        resp = send_file(f, mimetype=content_type, as_attachment=True,
+                         download_name=filename, conditional=False)
+        resp.content_length = os.fstat(f.fileno()).st_size
+
         # Path 2: Download succeeds
         return resp
-        
+
+    except resilience.Unavailable:
+        raise   # 503 + Retry-After (app.py)
     except Exception as e:
         # Path 3: AWS/S3 crashes
         return f"Download failed: {str(e)}", 500
 
 
+@login_required
+def export_zip():
+    """
+    Stream a ZIP of the user's photos: all of them, or only the ids given
+    as ?ids=1,2,3 (GET) or repeated "ids" form fields (POST).
+    """
+    user_id = session["user_id"]
+    ids = _parse_ids(request.values.getlist("ids"))
+
+    if ids:
+        photos = db.get_photos(user_id, ids)
+    else:
+        photos = db.list_photos(user_id, limit=export.MAX_PHOTOS)
+    if not photos:
+        return "No photos to export.", 404
+
+    resp = Response(stream_with_context(export.stream_zip(photos)), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = 'attachment; filename="photos.zip"'
+    return resp
+
+
 # ---------------------------------------------------------------------------
 # App routes: attach URL paths to handlers (called from app.py)
 # ---------------------------------------------------------------------------
@@ -361,6 +541,12 @@ def app_routes(app):
     """
     app.add_url_rule("/", "home", home)
     app.add_url_rule("/db-check", "db_check", db_check)
+    app.add_url_rule("/healthz", "liveness", liveness)
+    app.add_url_rule("/readyz", "readiness", readiness)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    app.add_url_rule("/db-shadow", "db_shadow", db_shadow)
+    app.add_url_rule("/profiles", "profiles", profiles)
+    app.add_url_rule("/profiles/<request_id>", "profile_view", profile_view)
     app.add_url_rule("/login", "login", login, methods=["GET", "POST"])
     app.add_url_rule("/signup", "signup", signup, methods=["GET", "POST"])
     app.add_url_rule("/logout", "logout", logout)
@@ -368,5 +554,11 @@ def app_routes(app):
     app.add_url_rule("/upload", "upload", upload, methods=["GET", "POST"])
     app.add_url_rule("/gallery", "gallery", gallery)
     app.add_url_rule("/search", "search", search, methods=["GET", "POST"])
+    app.add_url_rule("/api/photos", "api_photos", api_photos)
+    app.add_url_rule("/api/search", "api_search", api_search)
+    app.add_url_rule("/search/suggest", "autocomplete", autocomplete)
+    app.add_url_rule("/duplicates", "duplicates", duplicates)
+    app.add_url_rule("/photo/<int:photo_id>", "photo_detail", photo_detail)
     app.add_url_rule("/download/<int:photo_id>", "download", download)
+    app.add_url_rule("/export", "export", export_zip, methods=["GET", "POST"])
     
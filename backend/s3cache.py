@@ -0,0 +1,223 @@
+"""
+On-instance disk cache for S3 objects.
+
+Objects are stored under S3_CACHE_DIR keyed by a hash of (bucket, key).
+Keys written by routes.upload are never overwritten, so cached entries
+never need invalidation — only eviction when the directory grows past
+S3_CACHE_MB. The directory is shared by every worker on the instance:
+
+- Recency is the file's mtime (bumped on hits at most once a minute) and
+  eviction removes the least recently used files first.
+- The directory's total size is a counter in SIZE_FILE, updated under
+  flock by every fill in every worker, so eviction runs as soon as the
+  shared total passes the budget (not N workers' worth of it). Eviction
+  rescans the directory and writes the true total back.
+- Fills are single-flight: a per-key flock makes a thundering herd wait
+  for one S3 fetch, across threads and worker processes alike. Eviction
+  never deletes the lock files.
+- Files are written to a temp name and renamed into place, so readers
+  never see a partial object.
+
+Callers get an open file object (still readable if the entry is evicted
+meanwhile) and serve it with Flask's send_file, which gunicorn turns
+into sendfile().
+"""
+#------------------------------- imports -------------------------------------#
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+import clients
+import metrics
+import resilience
+
+
+# Bump a hit file's mtime at most this often (seconds).
+TOUCH_INTERVAL = 60
+# Evict down to this fraction of the budget so eviction is not run per fill.
+EVICT_TO = 0.9
+# Shared byte count of the cached objects, in the cache directory.
+SIZE_FILE = ".size"
+
+
+def cache_dir():
+    return os.environ.get("S3_CACHE_DIR", "/tmp/photo-s3-cache")
+
+
+def _budget_bytes():
+    return int(float(os.environ.get("S3_CACHE_MB", "1024")) * 1024 * 1024)
+
+
+def _path(bucket, key):
+    digest = hashlib.sha256(f"{bucket}/{key}".encode()).hexdigest()
+    return os.path.join(cache_dir(), digest[:2], digest)
+
+
+# ---------------------------------------------------------------------------
+# Eviction
+# ---------------------------------------------------------------------------
+
+def _scan():
+    """Return [(mtime, size, path), ...] for every cached object."""
+    entries = []
+    root = cache_dir()
+    if not os.path.isdir(root):
+        return entries
+    for sub in os.scandir(root):
+        if not sub.is_dir():
+            continue
+        for f in os.scandir(sub.path):
+            if f.name.endswith((".tmp", ".lock")):
+                continue
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f.path))
+    return entries
+
+
+def _evict():
+    """
+    Rescan the directory and delete least recently used objects until
+    under budget. Returns the bytes left.
+    """
+    entries = sorted(_scan())
+    total = sum(size for _, size, _ in entries)
+    target = _budget_bytes() * EVICT_TO
+    for _, size, path in entries:
+        if total <= target:
+            break
+        # The .lock file stays: a filler may be waiting on it, and unlinking
+        # it would let a newcomer lock a fresh file and fetch concurrently.
+        # Lock files are empty, so they only cost an inode per key.
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        metrics.inc("s3_cache_evictions_total")
+    return total
+
+
+def _account(nbytes):
+    """Add a fill to the shared size counter; evict once the total is over budget."""
+    fd = os.open(os.path.join(cache_dir(), SIZE_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+") as f:
+        # Serializes every thread and worker process (flock is per open file).
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            raw = f.read().strip()
+            # No count yet: the scan already includes this fill.
+            total = int(raw) + nbytes if raw else sum(size for _, size, _ in _scan())
+            if total > _budget_bytes():
+                total = _evict()
+            f.seek(0)
+            f.truncate()
+            f.write(str(total))
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    metrics.set_gauge("s3_cache_bytes", total)
+
+
+# ---------------------------------------------------------------------------
+# Lookup / fill
+# ---------------------------------------------------------------------------
+
+def _hit(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if time.time() - st.st_mtime > TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+    metrics.inc("s3_cache_hits_total")
+    metrics.inc("s3_cache_bytes_saved_total", st.st_size)
+    return True
+
+
+def _fill(bucket, key, path):
+    obj = resilience.call("s3", clients.s3().get_object, Bucket=bucket, Key=key, idempotent=True)
+    body = obj["Body"]
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            # The body streams after get_object returns, so keep it inside
+            # the request budget too: every read waits at most what is left.
+            _bound_read(body)
+            for chunk in _chunks(body):
+                f.write(chunk)
+                size += len(chunk)
+                left = resilience.remaining()
+                if left is not None and left <= 0:
+                    metrics.inc("deadline_exceeded_total", dependency="s3")
+                    raise resilience.Unavailable("s3", "request deadline exceeded")
+                _bound_read(body)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    metrics.inc("s3_cache_misses_total")
+    _account(size)
+
+
+def _bound_read(body):
+    try:
+        body.set_socket_timeout(resilience.attempt_timeout())
+    except AttributeError:
+        pass   # no socket behind it (fully read, or a stubbed response)
+
+
+def _chunks(body):
+    try:
+        yield from body.iter_chunks(1024 * 1024)
+    except Exception as e:
+        if resilience.is_transient(e):   # read timeout, connection reset
+            raise resilience.Unavailable("s3", f"{type(e).__name__}: {e}") from e
+        raise
+
+
+def get(bucket, key):
+    """
+    Return the local path of the cached object, fetching it from S3 first
+    if needed. Concurrent misses for the same object wait on one fetch.
+    """
+    path = _path(bucket, key)
+    if _hit(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Another thread or worker may have filled it while we waited.
+            if _hit(path):
+                return path
+            _fill(bucket, key, path)
+            return path
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def open_object(bucket, key):
+    """Return the cached object opened for binary reading."""
+    try:
+        f = open(get(bucket, key), "rb")
+    except FileNotFoundError:
+        # Evicted between lookup and open; fetch again.
+        f = open(get(bucket, key), "rb")
+    _update_ratio()
+    return f
+
+
+def _update_ratio():
+    hits = metrics.value("s3_cache_hits_total")
+    total = hits + metrics.value("s3_cache_misses_total")
+    metrics.set_gauge("s3_cache_hit_ratio", hits / total if total else 0.0)
@@ -29,6 +29,7 @@ CREATE TABLE IF NOT EXISTS photos (
     tags VARCHAR(500) NULL,
     content_type VARCHAR(100) NULL,
     size_bytes BIGINT UNSIGNED NULL,
+    phash CHAR(16) NULL,
     uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (id),
     KEY idx_photos_user_time (user_id, uploaded_at),
@@ -36,4 +37,7 @@ CREATE TABLE IF NOT EXISTS photos (
     KEY idx_photos_tags (tags),
     CONSTRAINT fk_photos_user
         FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-) ENGINE=InnoDB;
\ No newline at end of file
+) ENGINE=InnoDB;
+
+-- Existing databases created before the phash column:
+-- ALTER TABLE photos ADD COLUMN phash CHAR(16) NULL AFTER size_bytes;
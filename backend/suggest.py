@@ -0,0 +1,182 @@
+"""
+Search-as-you-type suggestions.
+
+Each user gets a compact prefix index over their photo titles and tags:
+a sorted array of (lowercased term, kind, display text) tuples searched
+with bisect. The index is built lazily from db.list_photos on the first
+keystroke, updated incrementally after each upload, and evicted
+least-recently-used once the estimated memory of all indexes passes
+SUGGEST_MEMORY_MB. Keystroke-rate requests never reach the database.
+
+Indexes older than SUGGEST_TTL seconds are rebuilt so uploads handled by
+other worker processes show up eventually. Builds are single-flight: one
+request per user builds, concurrent ones serve the stale index if there
+is one and otherwise wait for that build instead of starting their own.
+"""
+#------------------------------- imports -------------------------------------#
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+import db
+import metrics
+
+
+# Upper bound on photos read when building one user's index.
+BUILD_LIMIT = 100000
+
+_lock = threading.Lock()
+_indexes = OrderedDict()   # user_id -> _PrefixIndex, most recently used last
+_building = {}             # user_id -> threading.Event set when its build ends
+_total_bytes = 0
+
+
+def _budget_bytes():
+    return int(float(os.environ.get("SUGGEST_MEMORY_MB", "64")) * 1024 * 1024)
+
+
+def _ttl():
+    return float(os.environ.get("SUGGEST_TTL", "300"))
+
+
+# ---------------------------------------------------------------------------
+# Per-user prefix index
+# ---------------------------------------------------------------------------
+
+def _terms(photo):
+    """Yield (key, kind, display) entries for one photo."""
+    title = (photo.get("title") or "").strip()
+    if title:
+        words = title.lower().split()
+        # Every word suffix, so "bea" also matches "Sunset at the beach".
+        for i in range(len(words)):
+            yield " ".join(words[i:]), "title", title
+    for tag in (photo.get("tags") or "").split(","):
+        tag = tag.strip()
+        if tag:
+            yield tag.lower(), "tag", tag
+
+
+class _PrefixIndex:
+    """Sorted array of (key, kind, display) tuples for one user."""
+
+    def __init__(self, photos):
+        self.built_at = time.time()
+        self.entries = sorted({t for p in photos for t in _terms(p)})
+        self.nbytes = sum(self._entry_size(e) for e in self.entries)
+
+    @staticmethod
+    def _entry_size(entry):
+        # Tuple + two strings; "kind" is interned and not counted.
+        return sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[2])
+
+    def add(self, photo):
+        """Insert one photo's terms; return the number of bytes added."""
+        added = 0
+        for entry in _terms(photo):
+            i = bisect_left(self.entries, entry)
+            if i < len(self.entries) and self.entries[i] == entry:
+                continue
+            insort(self.entries, entry)
+            added += self._entry_size(entry)
+        self.nbytes += added
+        return added
+
+    def lookup(self, prefix, limit):
+        """Return {"titles": [...], "tags": [...]} matching prefix."""
+        titles, tags = [], []
+        seen = set()
+        i = bisect_left(self.entries, (prefix,))
+        while i < len(self.entries) and (len(titles) < limit or len(tags) < limit):
+            key, kind, display = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            bucket = titles if kind == "title" else tags
+            if len(bucket) < limit and (kind, display) not in seen:
+                seen.add((kind, display))
+                bucket.append(display)
+            i += 1
+        return {"titles": titles, "tags": tags}
+
+
+# ---------------------------------------------------------------------------
+# LRU bookkeeping
+# ---------------------------------------------------------------------------
+
+def _evict_locked():
+    """Drop least-recently-used indexes until under budget. Caller holds _lock."""
+    global _total_bytes
+    budget = _budget_bytes()
+    while _total_bytes > budget and len(_indexes) > 1:
+        _, index = _indexes.popitem(last=False)
+        _total_bytes -= index.nbytes
+        metrics.inc("suggest_evictions_total")
+    metrics.set_gauge("suggest_index_bytes", _total_bytes)
+
+
+def _get_index(user_id):
+    """Return the user's index, building it from the database if needed."""
+    global _total_bytes
+    key = str(user_id)
+    while True:
+        with _lock:
+            index = _indexes.get(key)
+            if index is not None and time.time() - index.built_at < _ttl():
+                _indexes.move_to_end(key)
+                return index
+            building = _building.get(key)
+            if building is None:
+                building = _building[key] = threading.Event()
+                break
+        if index is not None:
+            return index   # stale; another request is rebuilding it
+        building.wait()   # then re-check: the build may have failed
+
+    # Build outside the lock so one slow user does not block the others.
+    try:
+        metrics.inc("suggest_index_builds_total")
+        index = _PrefixIndex(db.list_photos(user_id, limit=BUILD_LIMIT))
+
+        with _lock:
+            old = _indexes.pop(key, None)
+            if old is not None:
+                _total_bytes -= old.nbytes
+            _indexes[key] = index
+            _total_bytes += index.nbytes
+            _evict_locked()
+        return index
+    finally:
+        with _lock:
+            del _building[key]
+        building.set()
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def suggest(user_id, q, limit=8):
+    """Return title and tag suggestions for prefix q."""
+    prefix = " ".join(q.lower().split())
+    if not prefix:
+        return {"titles": [], "tags": []}
+    index = _get_index(user_id)
+    with _lock:
+        return index.lookup(prefix, limit)
+
+
+def add_photo(user_id, title=None, tags=None):
+    """
+    Record a new upload in the user's index, if it is loaded.
+    An unloaded index will pick the photo up when it is built.
+    """
+    global _total_bytes
+    with _lock:
+        index = _indexes.get(str(user_id))
+        if index is None:
+            return
+        _total_bytes += index.add({"title": title, "tags": tags})
+        _evict_locked()